@@ -10,12 +10,17 @@ def _isnum(n):
 
 
 def plot(series, offset=3, label_format="{:5.0f}", minimum=0, maximum=None, height=None):
+    return '\n'.join(plot_rows(series, offset, label_format, minimum, maximum, height))
+
+
+def plot_rows(series, offset=3, label_format="{:5.0f}", minimum=0, maximum=None, height=None):
+    """Yields the chart one row at a time, so only a single row is held in memory."""
     if len(series) == 0:
-        return ''
+        return
 
     if not isinstance(series[0], list):
         if all(isnan(n) for n in series):
-            return ''
+            return
         else:
             series = [series]
 
@@ -47,48 +52,56 @@ def plot(series, offset=3, label_format="{:5.0f}", minimum=0, maximum=None, heig
         width = max(width, len(series[i]))
     width += offset
 
-    result = [[' '] * width for i in range(rows + 1)]
-
-    # axis and labels
-    for y in range(min2, max2 + 1):
-        label = label_format.format(maximum - ((y - min2) * interval / (rows if rows else 1)))
-        result[y - min2][max(offset - len(label), 0)] = label
-        result[y - min2][offset - 1] = symbols[0] if y == 0 else symbols[1]  # zero tick mark
-
-    # first value is a tick mark across the y-axis
     d0 = series[0][0]
-    if _isnum(d0):
-        result[rows - scaled(d0)][offset - 1] = symbols[0]
-
-    for i in range(0, len(series)):
-        # plot the line
-        for x in range(0, len(series[i]) - 1):
-            d0 = series[i][x + 0]
-            d1 = series[i][x + 1]
+    first_tick = rows - scaled(d0) if _isnum(d0) else -1
 
-            if isnan(d0) and isnan(d1):
-                continue
+    row = [' '] * width
+    for r in range(rows + 1):
+        y = r + min2
+        for x in range(width):
+            row[x] = ' '
 
-            if isnan(d0) and _isnum(d1):
-                result[rows - scaled(d1)][x + offset] = symbols[2]
-                continue
-
-            if _isnum(d0) and isnan(d1):
-                result[rows - scaled(d0)][x + offset] = symbols[3]
-                continue
-
-            y0 = scaled(d0)
-            y1 = scaled(d1)
-            if y0 == y1:
-                result[rows - y0][x + offset] = symbols[4]
-                continue
-
-            result[rows - y1][x + offset] = symbols[5] if y0 > y1 else symbols[6]
-            result[rows - y0][x + offset] = symbols[7] if y0 > y1 else symbols[8]
-
-            start = min(y0, y1) + 1
-            end = max(y0, y1)
-            for y in range(start, end):
-                result[rows - y][x + offset] = symbols[9]
-
-    return '\n'.join([''.join(row).rstrip() for row in result])
+        # axis and labels
+        label = label_format.format(maximum - ((y - min2) * interval / (rows if rows else 1)))
+        row[max(offset - len(label), 0)] = label
+        row[offset - 1] = symbols[0] if y == 0 else symbols[1]  # zero tick mark
+
+        # first value is a tick mark across the y-axis
+        if r == first_tick:
+            row[offset - 1] = symbols[0]
+
+        level = rows - r  # scaled value drawn on this row
+        for i in range(0, len(series)):
+            # plot the line
+            for x in range(0, len(series[i]) - 1):
+                d0 = series[i][x + 0]
+                d1 = series[i][x + 1]
+
+                if isnan(d0) and isnan(d1):
+                    continue
+
+                if isnan(d0) and _isnum(d1):
+                    if scaled(d1) == level:
+                        row[x + offset] = symbols[2]
+                    continue
+
+                if _isnum(d0) and isnan(d1):
+                    if scaled(d0) == level:
+                        row[x + offset] = symbols[3]
+                    continue
+
+                y0 = scaled(d0)
+                y1 = scaled(d1)
+                if y0 == y1:
+                    if y0 == level:
+                        row[x + offset] = symbols[4]
+                    continue
+
+                if y0 == level:
+                    row[x + offset] = symbols[7] if y0 > y1 else symbols[8]
+                elif y1 == level:
+                    row[x + offset] = symbols[5] if y0 > y1 else symbols[6]
+                elif min(y0, y1) < level < max(y0, y1):
+                    row[x + offset] = symbols[9]
+
+        yield ''.join(row).rstrip()
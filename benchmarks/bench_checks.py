@@ -0,0 +1,110 @@
+# Measures the cost of HTTP, DNS, TCP and UDP checks against the stand-in servers.
+#
+# overhead is the time a check takes beyond the latency it reports, i.e. the time spent in minutePing's own code
+# and the event loop rather than waiting on the network. Bytes are those allocated by a single check, measured
+# while it is the only one running. The keep_alive figures are for HTTP services reusing one connection across
+# checks, and the tcp and udp figures are for TCP services connecting to the HTTP server and UDP services sending to
+# the echo server.
+import gc
+import time
+import harness
+import resolver
+import servers
+import uasyncio as asyncio
+from services import HTTPService, DNSService, TCPService, UDPService
+
+ROUNDS = 20
+MAX_CONCURRENT_CHECKS = 3
+
+
+def create_services(count, keep_alive=False):
+    services = []
+    for i in range(count):
+        if i % 2 == 0 or keep_alive:
+            services.append(HTTPService({"name": "http{}".format(i), "type": "http", "timeout": 2,
+                                         "host": "service{}.bench.test/status".format(i), "port": servers.HTTP_PORT,
+                                         "keep_alive": keep_alive}))
+        else:
+            services.append(DNSService({"name": "dns{}".format(i), "type": "dns", "timeout": 2,
+                                        "host": servers.HOST, "port": servers.DNS_PORT}))
+    return services
+
+
+async def measure_sequential(services):
+    overheads = []
+    allocated = {HTTPService: [], DNSService: [], TCPService: [], UDPService: []}
+    failed = 0
+    for _ in range(ROUNDS):
+        for service in services:
+            gc.collect()
+            before = gc.mem_alloc()
+            start = time.ticks_us()
+            await service.check()
+            elapsed = time.ticks_diff(time.ticks_us(), start)
+            if gc.mem_alloc() >= before:  # a collection ran during the check otherwise
+                allocated[type(service)].append(gc.mem_alloc() - before)
+
+            latency = service.get_history()[-1]
+            if latency != latency:  # NaN
+                failed += 1
+            else:
+                overheads.append(elapsed - int(latency * 1000))
+    return overheads, allocated, failed
+
+
+async def measure_concurrent(services):
+    next_check = [0]
+    total = ROUNDS * len(services)
+
+    async def worker():
+        while next_check[0] < total:
+            service = services[next_check[0] % len(services)]
+            next_check[0] += 1
+            await service.check()
+
+    start = time.ticks_us()
+    await asyncio.gather(*[worker() for _ in range(MAX_CONCURRENT_CHECKS)])
+    return total * 1000000 / time.ticks_diff(time.ticks_us(), start)
+
+
+async def run(report, service_count):
+    resolver.server = servers.HOST
+    resolver.port = servers.DNS_PORT
+    services = create_services(service_count)
+
+    overheads, allocated, failed = await measure_sequential(services)
+    checks_per_second = await measure_concurrent(services)
+
+    report("services", service_count)
+    report("checks_per_second", checks_per_second)
+    report("overhead_p50_us", harness.percentile(overheads, 50))
+    report("overhead_p99_us", harness.percentile(overheads, 99))
+    report("http_bytes_per_check", sum(allocated[HTTPService]) // max(1, len(allocated[HTTPService])))
+    report("dns_bytes_per_check", sum(allocated[DNSService]) // max(1, len(allocated[DNSService])))
+    report("failed_checks", failed)
+
+    services = create_services(max(1, service_count // 2), True)
+    overheads, allocated, failed = await measure_sequential(services)
+    checks, reused = 0, 0
+    for service in services:
+        checks += service.get_connection_stats()[0]
+        reused += service.get_connection_stats()[1]
+        await service._close()
+    report("keep_alive_overhead_p50_us", harness.percentile(overheads, 50))
+    report("keep_alive_bytes_per_check", sum(allocated[HTTPService]) // max(1, len(allocated[HTTPService])))
+    report("keep_alive_reuse_ratio", reused / max(1, checks))
+    report("keep_alive_failed_checks", failed)
+
+    services = []
+    for i in range(max(2, service_count // 2)):
+        if i % 2 == 0:
+            services.append(TCPService({"name": "tcp{}".format(i), "type": "tcp", "timeout": 2,
+                                        "host": servers.HOST, "port": servers.HTTP_PORT}))
+        else:
+            services.append(UDPService({"name": "udp{}".format(i), "type": "udp", "timeout": 2, "host": servers.HOST,
+                                        "port": servers.ECHO_PORT, "payload": "ping", "response_prefix": "ping"}))
+    overheads, allocated, failed = await measure_sequential(services)
+    report("tcp_udp_overhead_p50_us", harness.percentile(overheads, 50))
+    report("tcp_bytes_per_check", sum(allocated[TCPService]) // max(1, len(allocated[TCPService])))
+    report("udp_bytes_per_check", sum(allocated[UDPService]) // max(1, len(allocated[UDPService])))
+    report("tcp_udp_failed_checks", failed)
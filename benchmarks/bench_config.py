@@ -0,0 +1,78 @@
+# Measures boot-time configuration loading: parsing config.json in one json.load versus streaming the compiled
+# cache written by configcache, for a generated configuration with many services.
+from json import load, dumps
+from configcache import load_config
+import gc
+import time
+import uos
+import harness
+
+SERVICES = 50
+CONFIG_PATH = "benchmark_config.json"
+CACHE_PATH = "benchmark_config.cache"
+
+
+def write_config():
+    services = []
+    for i in range(SERVICES):
+        services.append({"name": "service{}".format(i), "type": ["http", "icmp", "dns"][i % 3],
+                         "host": "host{}.example.com/status".format(i), "check_interval": 180, "timeout": 2,
+                         "notify_after_failures": 3})
+    config = {"services": services,
+              "notifiers": [{"type": "email", "recipient_addresses": "ops@example.com", "smtp_server": "smtp.example.com",
+                             "port": 587, "username": "minuteping", "password": "hunter2"}],
+              "network": {"ssid": "network", "password": "hunter2"}, "web_server": True, "watchdog": True}
+    with open(CONFIG_PATH, "w") as config_file:
+        config_file.write(dumps(config))
+
+
+def measure_json():
+    gc.collect()
+    before = gc.mem_alloc()
+    harness.reset_peak()
+    start = time.ticks_us()
+    with open(CONFIG_PATH, "r") as config_file:
+        config = load(config_file)
+    peak = gc.mem_alloc() - before
+    count = 0
+    for service_config in config["services"]:
+        count += 1
+    elapsed = time.ticks_diff(time.ticks_us(), start)
+    del config
+    return elapsed, max(peak, harness.peak_alloc() - before), count
+
+
+def measure_cache():
+    gc.collect()
+    before = gc.mem_alloc()
+    harness.reset_peak()
+    start = time.ticks_us()
+    settings, records = load_config(CONFIG_PATH, CACHE_PATH)
+    peak = gc.mem_alloc() - before
+    count = 0
+    for kind, item_config in records:
+        peak = max(peak, gc.mem_alloc() - before)
+        if kind == "service":
+            count += 1
+        del item_config
+    elapsed = time.ticks_diff(time.ticks_us(), start)
+    return elapsed, max(peak, harness.peak_alloc() - before), count
+
+
+async def run(report, service_count):
+    write_config()
+    try:
+        uos.remove(CACHE_PATH)
+    except OSError:
+        pass
+
+    report("services", SERVICES)
+    report("config_bytes", uos.stat(CONFIG_PATH)[6])
+    for name, measure in (("json_load", measure_json), ("cache_compile", measure_cache), ("cache_load", measure_cache)):
+        elapsed, peak, count = measure()
+        assert count == SERVICES
+        report("{}_us".format(name), elapsed)
+        report("{}_heap_bytes".format(name), peak)
+
+    uos.remove(CONFIG_PATH)
+    uos.remove(CACHE_PATH)
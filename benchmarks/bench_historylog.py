@@ -0,0 +1,53 @@
+# Measures HistoryLog write and replay costs against a local directory.
+from historylog import HistoryLog, RECORD_SIZE, PAGE_SIZE
+import time
+import uos
+
+DIRECTORY = "benchmark_history"
+SERVICES = 16
+RECORDS = 20000
+
+
+class ReplayTarget:
+    def __init__(self):
+        self.records = 0
+
+    def record(self, latency, now):
+        self.records += 1
+
+
+def remove_directory():
+    try:
+        for name in uos.listdir(DIRECTORY):
+            uos.remove("{}/{}".format(DIRECTORY, name))
+        uos.rmdir(DIRECTORY)
+    except OSError:
+        pass
+
+
+async def run(report, service_count):
+    remove_directory()
+    names = ["service{}".format(i) for i in range(SERVICES)]
+    history_log = HistoryLog(names, directory=DIRECTORY, segment_size=64 * PAGE_SIZE, segments=4)
+
+    timestamp = int(time.time()) - RECORDS
+    start = time.ticks_us()
+    for i in range(RECORDS):
+        history_log.append(i % SERVICES, float("nan") if i % 50 == 0 else i % 500, timestamp + i)
+    history_log.flush()
+    write_us = time.ticks_diff(time.ticks_us(), start)
+
+    targets = [ReplayTarget() for _ in range(SERVICES)]
+    start = time.ticks_us()
+    replayed = HistoryLog(names, directory=DIRECTORY, segment_size=64 * PAGE_SIZE, segments=4).replay(targets)
+    replay_us = time.ticks_diff(time.ticks_us(), start)
+
+    report("record_size_bytes", RECORD_SIZE)
+    report("records_written", RECORDS)
+    report("write_us_per_record", write_us / RECORDS)
+    report("write_records_per_second", int(RECORDS * 1000000 / write_us))
+    report("records_replayed", replayed)
+    report("replay_us_per_record", replay_us / replayed if replayed else 0)
+    report("replay_records_per_second", int(replayed * 1000000 / replay_us) if replay_us else 0)
+
+    remove_directory()
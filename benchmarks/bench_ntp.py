@@ -0,0 +1,31 @@
+# Measures NTP queries against the stand-in server. round_trip is as measured by ntptime, the time for the
+# whole query includes resolving, the socket setup and parsing.
+import gc
+import time
+import harness
+import ntptime
+import servers
+
+QUERIES = 50
+
+
+async def run(report, service_count):
+    ntptime.host = servers.HOST
+    ntptime.port = servers.NTP_PORT
+
+    elapsed = []
+    round_trips = []
+    allocated = []
+    for _ in range(QUERIES):
+        gc.collect()
+        before = gc.mem_alloc()
+        start = time.ticks_us()
+        round_trips.append((await ntptime.query())[1])
+        elapsed.append(time.ticks_diff(time.ticks_us(), start))
+        if gc.mem_alloc() >= before:
+            allocated.append(gc.mem_alloc() - before)
+
+    report("query_p50_us", harness.percentile(elapsed, 50))
+    report("query_p99_us", harness.percentile(elapsed, 99))
+    report("round_trip_p50_ms", harness.percentile(round_trips, 50))
+    report("bytes_per_query", sum(allocated) // max(1, len(allocated)))
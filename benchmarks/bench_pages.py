@@ -0,0 +1,59 @@
+# Measures how long each web page takes to render for a number of services with full histories.
+# Pages are rendered into a counter rather than a socket, and the chart cache is disabled so every render draws
+# the whole chart. service_raw_update is a render with the cache enabled after one more check, which only draws the
+# newest column.
+import time
+from services import Service
+import pages
+
+RENDERS = 5
+
+
+def create_services(count):
+    services = []
+    for i in range(count):
+        service = Service({"name": "service{}".format(i), "host": "service{}.bench.test".format(i)})
+        now = time.ticks_ms()
+        for sample in range(service.max_history_length):
+            service.record(float("nan") if sample % 17 == 0 else 20 + (sample * 7 + i) % 90, now)
+        services.append(service)
+    return services
+
+
+def measure(render):
+    """Returns (mean render time in us, bytes rendered)."""
+    length = 0
+    start = time.ticks_us()
+    for _ in range(RENDERS):
+        length = 0
+        for fragment in render():
+            length += len(fragment)
+    return time.ticks_diff(time.ticks_us(), start) // RENDERS, length
+
+
+async def run(report, service_count):
+    pages.chart_cache.capacity = 0
+    services = create_services(service_count)
+    service = services[0]
+
+    for name, render in (("status", lambda: pages.status_page(services, "127.0.0.1")),
+                         ("service_raw", lambda: pages.service_page(service, "raw")),
+                         ("service_hour", lambda: pages.service_page(service, "hour")),
+                         ("api", lambda: pages.api_page(service)),
+                         ("history_feed", lambda: pages.history_feed(service, "raw")),
+                         ("metrics", lambda: pages.metrics_page(services)),
+                         ("debug", lambda: pages.debug_page(services))):
+        elapsed, length = measure(render)
+        report("{}_us".format(name), elapsed)
+        report("{}_bytes".format(name), length)
+
+    pages.chart_cache.capacity = 4096
+    measure(lambda: pages.service_page(service, "raw"))  # fills the cache
+    elapsed = 0
+    for sample in range(RENDERS):
+        service.record(20 + sample * 13, time.ticks_ms())
+        start = time.ticks_us()
+        for _ in pages.service_page(service, "raw"):
+            pass
+        elapsed += time.ticks_diff(time.ticks_us(), start)
+    report("service_raw_update_us", elapsed // RENDERS)
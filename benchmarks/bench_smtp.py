@@ -0,0 +1,42 @@
+# Compares sending a burst of emails over a new SMTP session each versus one reused session, then times a
+# digest notification from EmailNotifier, against the stand-in SMTP server. The server delays every reply by
+# servers.SMTP_RESPONSE_DELAY_MS to mimic a remote relay.
+import time
+import servers
+import umail
+from notifiers import EmailNotifier
+from services import Service
+
+MESSAGES = 20
+
+
+async def send_burst(smtp, reuse):
+    start = time.ticks_ms()
+    for i in range(MESSAGES):
+        try:
+            await smtp.connect(servers.HOST, servers.SMTP_PORT, "bench", "bench")
+            await smtp.to("bench@localhost")
+            await smtp.send("Subject: benchmark {}\n\nbody\n".format(i))
+            if not reuse:
+                await smtp.quit()
+        finally:
+            smtp.release()
+    elapsed = time.ticks_diff(time.ticks_ms(), start)
+    await smtp.quit()
+    return elapsed
+
+
+async def run(report, service_count):
+    for name, reuse in (("new_session", False), ("reused_session", True)):
+        elapsed = await send_burst(umail.SMTP(60), reuse)
+        report("{}_ms_per_message".format(name), elapsed / MESSAGES)
+
+    notifier = EmailNotifier({"recipient_addresses": "bench@localhost", "smtp_server": servers.HOST,
+                              "port": servers.SMTP_PORT, "username": "bench", "password": "bench"})
+    events = [(Service({"name": "service{}".format(i), "host": "service{}.bench.test".format(i)}), "offline", 540,
+               time.ticks_ms()) for i in range(service_count)]
+    start = time.ticks_ms()
+    sent = await notifier.notify(events)
+    report("digest_ms", time.ticks_diff(time.ticks_ms(), start))
+    report("digest_sent", 1 if sent else 0)
+    await notifier.smtp.quit()
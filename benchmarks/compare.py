@@ -0,0 +1,31 @@
+# Compares two results files written by benchmarks/run.py, printing the change of every metric in both.
+#   python3 benchmarks/compare.py before.txt after.txt
+import sys
+
+
+def load_results(path):
+    results = {}
+    order = []
+    with open(path, "r") as results_file:
+        for line in results_file:
+            if line.startswith("#") or not line.strip():
+                continue
+            metric, value = line.split()
+            results[metric] = float(value)
+            order.append(metric)
+    return order, results
+
+
+before_order, before = load_results(sys.argv[1])
+after_order, after = load_results(sys.argv[2])
+
+print("{:<45} {:>14} {:>14} {:>9}".format("metric", sys.argv[1], sys.argv[2], "change"))
+for metric in before_order:
+    if metric not in after:
+        continue
+    change = "{:+.1f}%".format((after[metric] - before[metric]) * 100 / before[metric]) if before[metric] else "n/a"
+    print("{:<45} {:>14} {:>14} {:>9}".format(metric, before[metric], after[metric], change))
+
+for metric in after_order:
+    if metric not in before:
+        print("{:<45} {:>14} {:>14}".format(metric, "-", after[metric]))
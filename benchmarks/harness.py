@@ -0,0 +1,75 @@
+# Shared setup and result reporting for the benchmarks in this directory.
+#
+# Under CPython the modules in benchmarks/shims stand in for the MicroPython ones, the ticks functions are added to
+# time and gc.mem_alloc is provided by tracemalloc. CPython figures are only meaningful when compared with other
+# CPython runs on the same machine.
+import sys
+import gc
+import time
+
+MICROPYTHON = sys.implementation.name == "micropython"
+HEAP_SIZE = 1 << 26  # reported total for gc.mem_free under CPython
+
+
+def setup():
+    sys.path.append("")  # the repository root, benchmarks are run from it
+    if MICROPYTHON:
+        return
+
+    sys.path.insert(0, "benchmarks/shims")
+    import tracemalloc
+    import utime
+
+    for name in ("ticks_ms", "ticks_us", "ticks_add", "ticks_diff", "sleep_ms"):
+        setattr(time, name, getattr(utime, name))
+
+    tracemalloc.start()
+    gc.mem_alloc = lambda: tracemalloc.get_traced_memory()[0]
+    gc.mem_free = lambda: HEAP_SIZE - gc.mem_alloc()
+
+
+def reset_peak():
+    """Starts a new allocation peak measurement. Only CPython tracks peaks, MicroPython callers sample mem_alloc."""
+    if not MICROPYTHON:
+        import tracemalloc
+        tracemalloc.reset_peak()
+
+
+def peak_alloc():
+    if MICROPYTHON:
+        return 0
+    import tracemalloc
+    return tracemalloc.get_traced_memory()[1]
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of values, 0 if there are none."""
+    if len(values) == 0:
+        return 0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, (len(ordered) * percent + 99) // 100 - 1))]
+
+
+class Results:
+    """Results as "<benchmark>.<metric> <value>" lines, in the order they are reported.
+
+    Integers are written as is and other numbers with two decimal places, so the output of two versions can be
+    compared line by line with benchmarks/compare.py.
+    """
+
+    def __init__(self):
+        self.lines = ["# minutePing benchmarks, {} {}".format(
+            sys.implementation.name, ".".join([str(part) for part in sys.implementation.version[:3]]))]
+        self.benchmark = None
+
+    def report(self, metric, value):
+        if not isinstance(value, int):
+            value = "{:.2f}".format(value)
+        line = "{}.{} {}".format(self.benchmark, metric, value)
+        self.lines.append(line)
+        print(line)
+
+    def write(self, path):
+        with open(path, "w") as output:
+            for line in self.lines:
+                output.write(line + "\n")
@@ -0,0 +1,55 @@
+# Runs the benchmarks against local stand-in servers and writes the results to a file for comparison between
+# versions with benchmarks/compare.py.
+#
+# Run from the repository root, with the MicroPython Unix port or CPython:
+#   micropython benchmarks/run.py [-n services] [-o results file] [benchmark ...]
+#   python3 benchmarks/run.py -n 20 -o before.txt checks pages
+import sys
+import harness
+
+harness.setup()
+
+import servers
+import uasyncio as asyncio
+
+BENCHMARKS = ("checks", "pages", "smtp", "ntp", "historylog", "config")
+
+
+def parse_arguments(arguments):
+    service_count = 20
+    output = "benchmark_results.txt"
+    selected = []
+    i = 0
+    while i < len(arguments):
+        if arguments[i] == "-n":
+            service_count = int(arguments[i + 1])
+            i += 1
+        elif arguments[i] == "-o":
+            output = arguments[i + 1]
+            i += 1
+        elif arguments[i] in BENCHMARKS:
+            selected.append(arguments[i])
+        else:
+            raise ValueError("Unknown benchmark {}, expected one of {}".format(arguments[i], ", ".join(BENCHMARKS)))
+        i += 1
+    # always in the same order, so results files line up
+    return service_count, output, [name for name in BENCHMARKS if name in selected or len(selected) == 0]
+
+
+async def main(service_count, selected, results):
+    servers.start()
+    await asyncio.sleep_ms(100)  # let the server threads start listening
+    try:
+        for name in selected:
+            module = __import__("bench_" + name)
+            results.benchmark = name
+            await module.run(results.report, service_count)
+    finally:
+        servers.stop()
+
+
+service_count, output, selected = parse_arguments(sys.argv[1:])
+results = harness.Results()
+asyncio.run(main(service_count, selected, results))
+results.write(output)
+print("Results written to", output)
@@ -0,0 +1,172 @@
+# Local stand-in HTTP, DNS, NTP, SMTP and UDP echo servers for the benchmarks, each on a loopback port.
+#
+# The servers run on their own threads with blocking sockets, so their work is not counted against the event loop
+# being measured. Every handled request increments the server's entry in served.
+import _thread
+import socket
+import time
+import ustruct
+
+HOST = "127.0.0.1"
+HTTP_PORT = 8080
+DNS_PORT = 5353
+NTP_PORT = 1123
+SMTP_PORT = 2525
+ECHO_PORT = 7007
+
+DNS_TTL = 60  # seconds, for every name other than minuteping.test
+NTP_DELTA = 2208988800  # seconds from 1900 to 1970
+SMTP_RESPONSE_DELAY_MS = 20  # added to every SMTP reply to mimic a remote relay
+
+served = {"http": 0, "dns": 0, "ntp": 0, "smtp": 0, "echo": 0}
+running = True
+
+
+def _address(port):
+    return socket.getaddrinfo(HOST, port)[0][-1]
+
+
+def _listen(port, kind):
+    sock = socket.socket(socket.AF_INET, kind)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(_address(port))
+    if kind == socket.SOCK_STREAM:
+        sock.listen(8)
+    sock.settimeout(0.5)  # so the thread notices stop()
+    return sock
+
+
+def _accept_loop(sock, handler):
+    while running:
+        try:
+            connection = sock.accept()[0]
+        except OSError:  # timed out
+            continue
+        connection.settimeout(5)
+        _thread.start_new_thread(_handle, (connection, handler))
+    sock.close()
+
+
+def _handle(connection, handler):
+    stream = connection.makefile("rwb", 0)
+    try:
+        handler(stream)
+    except OSError:
+        pass
+    finally:
+        stream.close()
+        connection.close()
+
+
+def _datagram_loop(sock, handler):
+    while running:
+        try:
+            request, client = sock.recvfrom(512)
+        except OSError:  # timed out
+            continue
+        response = handler(request)
+        if response is not None:
+            sock.sendto(response, client)
+    sock.close()
+
+
+def _http(stream):
+    """Answers HTTP/1.0 requests and closes, or keeps answering HTTP/1.1 requests on the same connection."""
+    while True:
+        request = stream.readline()
+        if not request:
+            return
+        while True:
+            line = stream.readline()
+            if not line or line == b"\r\n":
+                break
+        served["http"] += 1
+        if not request.rstrip().endswith(b"HTTP/1.1"):
+            stream.write(b"HTTP/1.0 200 OK\r\nContent-Type: text/plain\r\nContent-Length: 2\r\n\r\nok")
+            return
+        stream.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\nContent-Length: 2\r\n\r\nok")
+
+
+def _dns(request):
+    if len(request) < 17:
+        return None
+    end = 12
+    labels = []
+    while request[end] != 0:
+        labels.append(bytes(request[end + 1:end + 1 + request[end]]))
+        end += request[end] + 1
+    end += 5  # root label, type and class
+    served["dns"] += 1
+
+    question = request[12:end]
+    if b".".join(labels) == b"minuteping.test":
+        return request[:2] + b"\x81\x83\x00\x01\x00\x00\x00\x00\x00\x00" + question  # NXDOMAIN
+    return request[:2] + b"\x81\x80\x00\x01\x00\x01\x00\x00\x00\x00" + question + \
+        ustruct.pack("!HHHIH", 0xC00C, 1, 1, DNS_TTL, 4) + bytes([127, 0, 0, 1])
+
+
+def _ntp(request):
+    if len(request) < 48:
+        return None
+    served["ntp"] += 1
+    now = time.time() + NTP_DELTA
+    seconds = int(now)
+    fraction = int((now - seconds) * 4294967296)
+    response = bytearray(48)
+    response[0] = 0x24  # no leap warning, version 4, server mode
+    response[1] = 2  # stratum
+    ustruct.pack_into("!II", response, 32, seconds, fraction)  # receive timestamp
+    ustruct.pack_into("!II", response, 40, seconds, fraction)  # transmit timestamp
+    return response
+
+
+def _echo(request):
+    served["echo"] += 1
+    return request
+
+
+def _smtp_reply(stream, response):
+    time.sleep(SMTP_RESPONSE_DELAY_MS / 1000)
+    stream.write(response)
+
+
+def _smtp(stream):
+    _smtp_reply(stream, b"220 localhost ESMTP\r\n")
+    while True:
+        line = stream.readline()
+        if not line:
+            break
+        command = line[:4].upper()
+        if command == b"EHLO":
+            _smtp_reply(stream, b"250-localhost\r\n250 AUTH PLAIN LOGIN\r\n")
+        elif command == b"AUTH":
+            _smtp_reply(stream, b"235 Authentication succeeded\r\n")
+        elif command == b"DATA":
+            _smtp_reply(stream, b"354 End data with <CR><LF>.<CR><LF>\r\n")
+            while True:
+                line = stream.readline()
+                if not line or line == b".\r\n" or line.endswith(b"\r\n.\r\n"):
+                    break
+            served["smtp"] += 1
+            _smtp_reply(stream, b"250 Queued\r\n")
+        elif command == b"QUIT":
+            _smtp_reply(stream, b"221 Bye\r\n")
+            break
+        else:  # MAIL, RCPT, RSET, NOOP
+            _smtp_reply(stream, b"250 OK\r\n")
+
+
+def start():
+    """Starts every server. They stay up until stop() is called."""
+    global running
+    running = True
+    _thread.start_new_thread(_accept_loop, (_listen(HTTP_PORT, socket.SOCK_STREAM), _http))
+    _thread.start_new_thread(_accept_loop, (_listen(SMTP_PORT, socket.SOCK_STREAM), _smtp))
+    _thread.start_new_thread(_datagram_loop, (_listen(DNS_PORT, socket.SOCK_DGRAM), _dns))
+    _thread.start_new_thread(_datagram_loop, (_listen(NTP_PORT, socket.SOCK_DGRAM), _ntp))
+    _thread.start_new_thread(_datagram_loop, (_listen(ECHO_PORT, socket.SOCK_DGRAM), _echo))
+
+
+def stop():
+    global running
+    running = False
@@ -0,0 +1,33 @@
+# CPython stand-in for the parts of machine used by minutePing.
+import time
+
+
+class Pin:
+    OUT = 1
+
+    def __init__(self, pin, mode=None, value=None):
+        self.level = value
+
+    def __call__(self, value=None):
+        if value is None:
+            return self.level
+        self.level = value
+
+
+class RTC:
+    def datetime(self, value=None):
+        if value is None:
+            tm = time.gmtime()
+            return tm[0], tm[1], tm[2], tm[6] + 1, tm[3], tm[4], tm[5], 0
+
+
+class WDT:
+    def __init__(self, id=0, timeout=5000):
+        pass
+
+    def feed(self):
+        pass
+
+
+def freq(value=None):
+    return 160000000
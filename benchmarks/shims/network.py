@@ -0,0 +1,30 @@
+# Stand-in for the network module: a station interface that is always connected to loopback.
+STA_IF = 0
+AP_IF = 1
+AUTH_WPA_WPA2_PSK = 4
+
+
+class WLAN:
+    def __init__(self, interface):
+        self.interface = interface
+        self.enabled = False
+        self.address = ("127.0.0.1", "255.0.0.0", "127.0.0.1", "127.0.0.1")
+
+    def active(self, value=None):
+        if value is None:
+            return self.enabled
+        self.enabled = value
+
+    def connect(self, ssid, password):
+        pass
+
+    def isconnected(self):
+        return True
+
+    def ifconfig(self, address=None):
+        if address is None:
+            return self.address
+        self.address = address
+
+    def config(self, **kwargs):
+        pass
@@ -0,0 +1,108 @@
+# CPython stand-in for uasyncio v3: asyncio plus the MicroPython additions, and StreamReader/StreamWriter
+# constructed directly from a non-blocking socket as minutePing does. As in uasyncio, both are the same class, so a
+# single stream can read and write.
+from asyncio import *
+import asyncio as _asyncio
+
+
+class TimeoutError(Exception):
+    """On CPython asyncio.TimeoutError is an OSError, so it would be caught by minutePing's OSError handlers."""
+
+
+async def wait_for(awaitable, timeout):
+    try:
+        return await _asyncio.wait_for(awaitable, timeout)
+    except _asyncio.TimeoutError:
+        raise TimeoutError()
+
+
+async def wait_for_ms(awaitable, timeout):
+    return await wait_for(awaitable, timeout / 1000)
+
+
+async def sleep_ms(ms):
+    await _asyncio.sleep(ms / 1000)
+
+
+class _IOQueue:
+    def queue_write(self, sock):
+        """Returns a future completed once sock is writable. uasyncio's queue_write puts the current task in the IO
+        queue, which it then waits in by yielding, and tasks on CPython wait in the same way by yielding a future."""
+        loop = _asyncio.get_running_loop()
+        fd = sock.fileno()
+        future = loop.create_future()
+        loop.add_writer(fd, lambda: future.done() or future.set_result(None))
+        future.add_done_callback(lambda future: loop.remove_writer(fd))  # also when the waiting task is cancelled
+        future._asyncio_future_blocking = True  # as Future.__await__ sets it before yielding the future
+        return future
+
+
+class core:
+    _io_queue = _IOQueue()
+
+
+class Stream:
+    def __init__(self, sock, extra=None):
+        self.s = sock
+        self.buffer = b''
+        self.pending = b''
+
+    async def _fill(self):
+        data = await _asyncio.get_running_loop().sock_recv(self.s, 4096)
+        self.buffer += data
+        return data
+
+    async def read(self, n=-1):
+        if not self.buffer:
+            await self._fill()
+        if n < 0:
+            n = len(self.buffer)
+        data, self.buffer = self.buffer[:n], self.buffer[n:]
+        return data
+
+    async def readinto(self, buf):
+        if not self.buffer:
+            await self._fill()
+        n = min(len(buf), len(self.buffer))
+        buf[:n] = self.buffer[:n]
+        self.buffer = self.buffer[n:]
+        return n
+
+    async def readexactly(self, n):
+        while len(self.buffer) < n:
+            if not await self._fill():
+                raise EOFError
+        data, self.buffer = self.buffer[:n], self.buffer[n:]
+        return data
+
+    async def readline(self):
+        while b'\n' not in self.buffer:
+            if not await self._fill():
+                data, self.buffer = self.buffer, b''
+                return data
+        end = self.buffer.index(b'\n') + 1
+        data, self.buffer = self.buffer[:end], self.buffer[end:]
+        return data
+
+    def write(self, buf):
+        if isinstance(buf, str):
+            buf = buf.encode()
+        self.pending += bytes(buf)
+
+    async def drain(self):
+        pending, self.pending = self.pending, b''
+        if pending:
+            await _asyncio.get_running_loop().sock_sendall(self.s, pending)
+
+    def close(self):
+        try:
+            self.s.close()
+        except OSError:
+            pass
+
+    async def wait_closed(self):
+        pass
+
+
+StreamReader = Stream
+StreamWriter = Stream
@@ -0,0 +1,6 @@
+from binascii import *
+import binascii as _binascii
+
+
+def b2a_base64(data):  # MicroPython also accepts str
+    return _binascii.b2a_base64(data.encode() if isinstance(data, str) else data)
@@ -0,0 +1 @@
+from hashlib import *
@@ -0,0 +1,31 @@
+# CPython stand-in for uselect: poll objects that report registered objects rather than file descriptors, with
+# MicroPython's ipoll.
+import select as _select
+from select import POLLIN, POLLOUT, POLLERR, POLLHUP
+
+
+class Poll:
+    def __init__(self):
+        self.poller = _select.poll()
+        self.objects = {}  # fd: registered object
+
+    def register(self, obj, mask=POLLIN | POLLOUT):
+        self.objects[obj.fileno()] = obj
+        self.poller.register(obj, mask)
+
+    def modify(self, obj, mask):
+        self.poller.modify(obj, mask)
+
+    def unregister(self, obj):
+        del self.objects[obj.fileno()]
+        self.poller.unregister(obj)
+
+    def poll(self, timeout=-1):
+        return [(self.objects[fd], event) for fd, event in self.poller.poll(timeout)]
+
+    def ipoll(self, timeout=-1, flags=0):
+        return iter(self.poll(timeout))
+
+
+def poll():
+    return Poll()
@@ -0,0 +1,23 @@
+# CPython stand-in for utime. The ticks functions do not wrap, which ticks_diff and ticks_add handle equally.
+from time import *
+import time as _time
+
+
+def ticks_ms():
+    return int(_time.monotonic() * 1000)
+
+
+def ticks_us():
+    return int(_time.monotonic() * 1000000)
+
+
+def ticks_add(ticks, delta):
+    return ticks + delta
+
+
+def ticks_diff(end, start):
+    return end - start
+
+
+def sleep_ms(ms):
+    _time.sleep(ms / 1000)
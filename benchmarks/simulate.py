@@ -0,0 +1,603 @@
+# Runs main.py under CPython with a virtual clock and simulated network, so hours of monitoring take seconds.
+#
+#   python3 benchmarks/simulate.py benchmarks/scenarios/mass_outage.json [-o results file] [-l log file]
+#
+# The event loop never sleeps: when every task is waiting it jumps the clock to the next timer. Sockets are replaced
+# by simulated ones that answer HTTP, DNS, NTP, SMTP and ICMP after the latency the scenario gives the host at that
+# moment, or not at all while it is failing. CPU time is not simulated, so the results show how the schedule, timeouts
+# and notifications interact, not whether the board is fast enough.
+#
+# A scenario is a JSON object:
+#   config: the contents of config.json to boot, or config_file: a path relative to the scenario
+#   scale: (optional) number of copies of every configured service, named <name>-<n>. Defaults to 1
+#   duration: seconds of monitoring to simulate
+#   seed: (optional) for the random jitter and loss. Defaults to 1
+#   default: (optional) conditions of every host when no event applies
+#   events: (optional) list of conditions applied from "from" until "to" seconds (or the end) to "hosts" (or all)
+# Conditions are latency (ms, default 20), jitter (ms, default 0), loss (0 to 1), fail (no answer at all) and
+# status (HTTP response code, default 200). Hosts are named as in the configuration, with the DNS server the board
+# uses called "resolver".
+import sys
+import harness
+
+harness.setup()
+
+import asyncio as real_asyncio
+import contextlib
+import gc
+import json
+import os
+import random
+import selectors
+import tempfile
+import time
+import tracemalloc
+import ustruct
+import utime
+
+START = 820454400  # 2026-01-01 00:00:00 UTC, in seconds since 2000 as on the board
+EPOCH_OFFSET = 946684800  # seconds from 1970 to 2000
+NTP_DELTA = 3155673600  # seconds from 1900 to 2000
+DNS_TTL = 300
+STATUS_TEXT = {200: "OK", 301: "Moved Permanently", 404: "Not Found", 500: "Internal Server Error",
+               503: "Service Unavailable"}
+
+
+class Clock:
+    now = 0.0  # seconds since boot
+
+
+clock = Clock()
+real_gmtime = time.gmtime
+
+
+def virtual_ticks_ms():
+    return int(clock.now * 1000)
+
+
+def virtual_ticks_us():
+    return int(clock.now * 1000000)
+
+
+def virtual_time():
+    return START + int(clock.now)
+
+
+def virtual_gmtime(seconds=None):
+    return real_gmtime((virtual_time() if seconds is None else seconds) + EPOCH_OFFSET)
+
+
+def virtual_sleep(seconds):
+    raise RuntimeError("Blocking sleep of {} seconds in simulation".format(seconds))
+
+
+class VirtualSelector(selectors.SelectSelector):
+    """Instead of waiting for the next timer, moves the clock forward to it. No real file descriptors are used."""
+
+    def select(self, timeout=None):
+        if timeout is None:
+            raise RuntimeError("Every task is waiting with no timer pending")
+        clock.now += timeout
+        return []
+
+
+class VirtualLoop(real_asyncio.SelectorEventLoop):
+    def __init__(self):
+        real_asyncio.SelectorEventLoop.__init__(self, VirtualSelector())
+        self._clock_resolution = 1e-6
+
+    def time(self):
+        return clock.now
+
+    def call_exception_handler(self, context):
+        if simulation is not None:
+            simulation.task_errors += 1
+        real_asyncio.SelectorEventLoop.call_exception_handler(self, context)
+
+
+class VirtualLoopPolicy(real_asyncio.DefaultEventLoopPolicy):
+    """Always returns the same loop, so tasks created before asyncio.run, as MicroPython allows, run with it."""
+
+    def __init__(self, loop):
+        real_asyncio.DefaultEventLoopPolicy.__init__(self)
+        self.loop = loop
+
+    def new_event_loop(self):
+        return self.loop
+
+
+class Simulation:
+    def __init__(self, scenario):
+        self.duration = scenario["duration"]
+        self.default = scenario["default"] if "default" in scenario else {}
+        self.events = scenario["events"] if "events" in scenario else []
+        self.random = random.Random(scenario["seed"] if "seed" in scenario else 1)
+
+        self.names = {}  # address: host name
+        self.addresses = {}  # host name: address
+        self.smtp_hosts = set()
+
+        self.emails = []  # (seconds since boot, subject, body)
+        self.exited_at = None  # seconds since boot, if minutePing stopped before the end
+        self.task_errors = 0  # uncaught exceptions in tasks
+        self.finished = False
+        self.smtp_sessions = 0
+        self.schedule_lags = []
+        self.checks_started = {}  # service name: count
+
+    def conditions(self, host):
+        conditions = {"latency": 20, "jitter": 0, "loss": 0, "fail": False, "status": 200}
+        conditions.update(self.default)
+        for event in self.events:
+            if clock.now < event["from"] or ("to" in event and clock.now >= event["to"]):
+                continue
+            if "hosts" in event and host not in event["hosts"]:
+                continue
+            for key in conditions:
+                if key in event:
+                    conditions[key] = event[key]
+        return conditions
+
+    def round_trip(self, host):
+        """Seconds for a request to host to be answered now, or None if it will not be."""
+        conditions = self.conditions(host)
+        if conditions["fail"] or self.random.random() < conditions["loss"]:
+            return None
+        latency = conditions["latency"] + self.random.uniform(-conditions["jitter"], conditions["jitter"])
+        return max(latency, 0.1) / 1000
+
+    def address_of(self, name):
+        if name not in self.addresses:
+            index = len(self.addresses) + 1
+            address = "10.{}.{}.{}".format(index >> 16 & 0xFF, index >> 8 & 0xFF, index & 0xFF)
+            self.addresses[name] = address
+            self.names[address] = name
+        return self.addresses[name]
+
+    def host_name(self, address):
+        resolver = sys.modules.get("resolver")
+        if resolver is not None and address == resolver.server:
+            return "resolver"
+        return self.names.get(address, address)
+
+    def create_peer(self, sock, address):
+        host = self.host_name(address[0])
+        if sock.type == SOCK_DGRAM:
+            if address[1] == 123:
+                return NTPPeer(self, sock, host)
+            return DNSPeer(self, sock, host)
+        if host in self.smtp_hosts:
+            self.smtp_sessions += 1
+            return SMTPPeer(self, sock, host)
+        return HTTPPeer(self, sock, host)
+
+
+simulation = None
+
+AF_INET = 2
+SOCK_STREAM = 1
+SOCK_DGRAM = 2
+SOCK_RAW = 3
+SOL_SOCKET = 1
+SO_REUSEADDR = 2
+
+
+class SimulatedSocket:
+    """Non-blocking socket whose received data is scheduled by a peer, each piece arriving at a given time."""
+
+    def __init__(self, family=AF_INET, type=SOCK_STREAM, proto=0):
+        self.type = type
+        self.peer = None
+        self.connected_at = None  # seconds since boot, None until connect() or if the connection is never made
+        self.inbox = []  # (arrival, sequence, data), data None for the end of the stream
+        self.sequence = 0
+        self.wake = None
+        self.closed = False
+
+    def setblocking(self, flag):
+        pass
+
+    def settimeout(self, timeout):
+        pass
+
+    def setsockopt(self, level, option, value):
+        pass
+
+    def connect(self, address):
+        self.peer = simulation.create_peer(self, address)
+        if self.type == SOCK_STREAM:
+            round_trip = simulation.round_trip(self.peer.host)
+            if round_trip is not None:
+                self.connected_at = clock.now + round_trip
+                self.peer.connected(round_trip)
+            raise OSError(115, "EINPROGRESS")  # CPython only sets errno from two arguments
+        self.connected_at = clock.now
+
+    def send(self, data):  # queries of DNS services, sent without a stream
+        if not self.closed:
+            self.peer.receive(bytes(data))
+        return len(data)
+
+    def sendto(self, data, address):  # echo requests from the ICMP engine
+        round_trip = simulation.round_trip(simulation.host_name(address[0]))
+        if round_trip is not None:
+            reply = bytearray(20) + bytearray(data)
+            reply[0] = 0x45  # IPv4, 20 byte header
+            reply[20] = 0  # echo reply
+            self.deliver(round_trip, bytes(reply))
+        return len(data)
+
+    def close(self):
+        self.closed = True
+
+    def deliver(self, delay, data):
+        self.sequence += 1
+        self.inbox.append((clock.now + delay, self.sequence, data))
+        self.inbox.sort()
+        if self.wake is not None:
+            self.wake.set()
+
+    async def wait_connected(self):
+        while self.connected_at is None or self.connected_at > clock.now:
+            if self.connected_at is None:
+                await real_asyncio.Future()  # never completes, the caller's timeout ends the wait
+            await real_asyncio.sleep(self.connected_at - clock.now)
+
+    async def receive(self, size):
+        while True:
+            if self.inbox and self.inbox[0][0] <= clock.now:
+                arrival, sequence, data = self.inbox[0]
+                if data is None:
+                    return b''
+                if len(data) > size and self.type == SOCK_STREAM:
+                    self.inbox[0] = (arrival, sequence, data[size:])
+                    return data[:size]
+                self.inbox.pop(0)
+                return data[:size]
+            if self.inbox:
+                await real_asyncio.sleep(self.inbox[0][0] - clock.now)
+            else:
+                if self.wake is None:
+                    self.wake = real_asyncio.Event()
+                self.wake.clear()
+                await self.wake.wait()
+
+    def unread(self, data):
+        self.inbox.insert(0, (clock.now, 0, data))
+
+
+def getaddrinfo(host, port, *args):
+    return [(AF_INET, SOCK_STREAM, 0, '', (simulation.address_of(host), port))]
+
+
+class Peer:
+    def __init__(self, simulation, sock, host):
+        self.simulation = simulation
+        self.sock = sock
+        self.host = host
+        self.buffer = b''
+
+    def connected(self, round_trip):
+        pass
+
+    def reply(self, data):
+        round_trip = self.simulation.round_trip(self.host)
+        if round_trip is not None:
+            self.sock.deliver(round_trip, data)
+        return round_trip
+
+
+class HTTPPeer(Peer):
+    def receive(self, data):
+        self.buffer += data
+        if b"\r\n\r\n" in self.buffer:
+            status = self.simulation.conditions(self.host)["status"]
+            if self.reply("HTTP/1.0 {} {}\r\nContent-Length: 2\r\n\r\nok".format(
+                    status, STATUS_TEXT.get(status, "Unknown")).encode()) is not None:
+                self.sock.deliver(self.sock.inbox[-1][0] - clock.now, None)
+
+
+class DNSPeer(Peer):
+    def receive(self, query):
+        end = 12
+        labels = []
+        while query[end] != 0:
+            labels.append(query[end + 1:end + 1 + query[end]].decode())
+            end += query[end] + 1
+        end += 5
+        name = ".".join(labels)
+        if name == "minuteping.test":  # the query of DNS services, answered with NXDOMAIN
+            self.reply(query[:2] + b"\x81\x83\x00\x01\x00\x00\x00\x00\x00\x00" + query[12:end])
+        else:
+            address = bytes([int(part) for part in self.simulation.address_of(name).split(".")])
+            self.reply(query[:2] + b"\x81\x80\x00\x01\x00\x01\x00\x00\x00\x00" + query[12:end] +
+                       ustruct.pack("!HHHIH", 0xC00C, 1, 1, DNS_TTL, 4) + address)
+
+
+class NTPPeer(Peer):
+    def receive(self, request):
+        round_trip = self.simulation.round_trip(self.host)
+        if round_trip is None:
+            return
+        now = START + clock.now + round_trip / 2 + NTP_DELTA
+        response = bytearray(48)
+        response[0] = 0x24
+        ustruct.pack_into("!II", response, 40, int(now), int((now - int(now)) * 4294967296))
+        self.sock.deliver(round_trip, bytes(response))
+
+
+class SMTPPeer(Peer):
+    def __init__(self, simulation, sock, host):
+        Peer.__init__(self, simulation, sock, host)
+        self.in_data = False
+
+    def connected(self, round_trip):
+        self.sock.deliver(round_trip, b"220 simulated ESMTP\r\n")
+
+    def receive(self, data):
+        self.buffer += data
+        while True:
+            if self.in_data:
+                end = self.buffer.find(b"\r\n.\r\n")
+                if end < 0:
+                    return
+                self.record(self.buffer[:end])
+                self.buffer = self.buffer[end + 5:]
+                self.in_data = False
+                self.reply(b"250 Queued\r\n")
+                continue
+
+            end = self.buffer.find(b"\r\n")
+            if end < 0:
+                return
+            command = self.buffer[:4].upper()
+            self.buffer = self.buffer[end + 2:]
+            if command == b"EHLO":
+                self.reply(b"250-simulated\r\n250 AUTH PLAIN LOGIN\r\n")
+            elif command == b"AUTH":
+                self.reply(b"235 Authentication succeeded\r\n")
+            elif command == b"DATA":
+                self.in_data = True
+                self.reply(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+            elif command == b"QUIT":
+                if self.reply(b"221 Bye\r\n") is not None:
+                    self.sock.deliver(self.sock.inbox[-1][0] - clock.now, None)
+            else:
+                self.reply(b"250 OK\r\n")
+
+    def record(self, message):
+        subject = ""
+        for line in message.decode().split("\n"):
+            if line.startswith("Subject: "):
+                subject = line[9:].strip()
+        self.simulation.emails.append((clock.now, subject, message.decode()))
+
+
+class SimulatedStream:
+    """Reads and writes a SimulatedSocket. Like uasyncio, the same class serves as StreamReader and StreamWriter."""
+
+    def __init__(self, sock, extra=None):
+        self.s = sock
+        self.pending = b''
+
+    async def read(self, n=-1):
+        return await self.s.receive(n if n >= 0 else 65536)
+
+    async def readinto(self, buf):
+        data = await self.s.receive(len(buf))
+        buf[:len(data)] = data
+        return len(data)
+
+    async def readexactly(self, n):
+        data = b''
+        while len(data) < n:
+            chunk = await self.s.receive(n - len(data))
+            if not chunk:
+                raise EOFError
+            data += chunk
+        return data
+
+    async def readline(self):
+        line = b''
+        while True:
+            chunk = await self.s.receive(65536)
+            if not chunk:
+                return line
+            end = chunk.find(b"\n")
+            if end >= 0:
+                if end + 1 < len(chunk):
+                    self.s.unread(chunk[end + 1:])
+                return line + chunk[:end + 1]
+            line += chunk
+
+    def write(self, buf):
+        if isinstance(buf, str):
+            buf = buf.encode()
+        self.pending += bytes(buf)
+
+    async def drain(self):
+        await self.s.wait_connected()
+        pending, self.pending = self.pending, b''
+        if pending and not self.s.closed:
+            self.s.peer.receive(pending)
+
+    def close(self):
+        self.s.close()
+
+    async def wait_closed(self):
+        pass
+
+
+def install(loop):
+    """Replaces the clock, sockets and parts of uasyncio seen by minutePing with the simulated ones."""
+    for module in (time, utime):
+        module.ticks_ms = virtual_ticks_ms
+        module.ticks_us = virtual_ticks_us
+        module.time = virtual_time
+        module.gmtime = virtual_gmtime
+        module.sleep = virtual_sleep
+
+    socket_module = type(sys)("socket")
+    for name in ("AF_INET", "SOCK_STREAM", "SOCK_DGRAM", "SOCK_RAW", "SOL_SOCKET", "SO_REUSEADDR", "getaddrinfo"):
+        setattr(socket_module, name, globals()[name])
+    socket_module.socket = SimulatedSocket
+    socket_module.error = OSError
+    sys.modules["socket"] = socket_module
+    sys.modules["usocket"] = socket_module
+
+    real_asyncio.set_event_loop_policy(VirtualLoopPolicy(loop))
+    real_asyncio.set_event_loop(loop)
+
+    import uasyncio
+
+    async def start_server(handler, host, port, backlog=5):
+        return None  # pages are not requested in the simulation
+
+    uasyncio.StreamReader = SimulatedStream
+    uasyncio.StreamWriter = SimulatedStream
+    uasyncio.start_server = start_server
+    uasyncio.create_task = loop.create_task
+
+    sys.print_exception = lambda exception: sys.excepthook(type(exception), exception, exception.__traceback__)
+
+
+def load_scenario(path):
+    with open(path, "r") as scenario_file:
+        scenario = json.load(scenario_file)
+    if "config_file" in scenario:
+        with open(os.path.join(os.path.dirname(path), scenario["config_file"]), "r") as config_file:
+            scenario["config"] = json.load(config_file)
+
+    config = scenario["config"]
+    config.pop("webrepl", None)  # not available off the board
+    scale = scenario["scale"] if "scale" in scenario else 1
+    if scale > 1:
+        services = []
+        for service_config in config["services"]:
+            for copy in range(scale):
+                scaled = dict(service_config)
+                scaled["name"] = "{}-{}".format(service_config["name"], copy)
+                services.append(scaled)
+        config["services"] = services
+    return scenario
+
+
+def record_schedule_lag(set_schedule_lag):
+    def wrapper(service, lag):
+        simulation.schedule_lags.append(lag)
+        simulation.checks_started[service.get_name()] = simulation.checks_started.get(service.get_name(), 0) + 1
+        set_schedule_lag(service, lag)
+    return wrapper
+
+
+def finish(loop):
+    simulation.finished = True
+    loop.stop()
+
+
+def run(scenario, log):
+    global simulation
+    simulation = Simulation(scenario)
+    config = scenario["config"]
+    for notifier_config in config["notifiers"] if "notifiers" in config else []:
+        if notifier_config["type"] == "email":
+            simulation.smtp_hosts.add(notifier_config["smtp_server"])
+
+    loop = VirtualLoop()
+    install(loop)
+    loop.call_at(simulation.duration, finish, loop)
+
+    root = os.getcwd()
+    sys.path[:] = [os.path.abspath(path) for path in sys.path]
+    directory = tempfile.mkdtemp(prefix="minuteping-simulation-")
+    with open(os.path.join(directory, "config.json"), "w") as config_file:
+        json.dump(config, config_file)
+
+    os.chdir(directory)
+    gc.collect()
+    baseline = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    namespace = {"__name__": "__main__"}
+    started = time.monotonic()
+    try:
+        import services
+        services.Service.set_schedule_lag = record_schedule_lag(services.Service.set_schedule_lag)
+
+        with open(os.path.join(root, "main.py"), "r") as main_file:
+            source = main_file.read()
+        with contextlib.redirect_stdout(log):
+            try:
+                exec(compile(source, "main.py", "exec"), namespace)
+            except RuntimeError as e:
+                if not simulation.finished:
+                    raise
+                print("Simulation stopped:", e)
+            except SystemExit:  # the global exception handler after an uncaught exception in a task
+                simulation.exited_at = clock.now
+    finally:
+        os.chdir(root)
+    return namespace, time.monotonic() - started, tracemalloc.get_traced_memory()[1] - baseline
+
+
+def report(results, namespace, elapsed, peak):
+    monitored_services = namespace["monitored_services"]
+    expected = 0
+    for service in monitored_services:
+        expected += int(simulation.duration // service.get_check_interval())
+    started = sum(simulation.checks_started.values())
+    lags = simulation.schedule_lags
+
+    results.benchmark = "simulation"
+    results.report("services", len(monitored_services))
+    results.report("simulated_seconds", int(simulation.duration))
+    results.report("wall_seconds", elapsed)
+    results.report("checks_expected", expected)
+    results.report("checks_started", started)
+    results.report("checks_skipped", max(0, expected - started))
+    results.report("schedule_lag_p50_ms", harness.percentile(lags, 50))
+    results.report("schedule_lag_p99_ms", harness.percentile(lags, 99))
+    results.report("schedule_lag_max_ms", max(lags) if lags else 0)
+    results.report("check_duration_max_ms", max([service.get_check_stats()[2] for service in monitored_services]))
+    results.report("heap_peak_bytes", peak)
+    results.report("emails_sent", len(simulation.emails))
+    results.report("smtp_sessions", simulation.smtp_sessions)
+    results.report("task_errors", simulation.task_errors)
+    if simulation.exited_at is not None:
+        results.lines.append("# minutePing exited after an uncaught exception at {:.0f} s".format(simulation.exited_at))
+        print(results.lines[-1])
+    for sent, subject, body in simulation.emails:
+        results.lines.append("# email at {:.0f} s: {}".format(sent, subject))
+        print(results.lines[-1])
+
+
+def main(arguments):
+    output = "simulation_results.txt"
+    log_path = os.devnull
+    scenario_path = None
+    i = 0
+    while i < len(arguments):
+        if arguments[i] == "-o":
+            output = arguments[i + 1]
+            i += 1
+        elif arguments[i] == "-l":
+            log_path = arguments[i + 1]
+            i += 1
+        else:
+            scenario_path = arguments[i]
+        i += 1
+    if scenario_path is None:
+        print("Usage: python3 benchmarks/simulate.py scenario.json [-o results file] [-l log file]")
+        sys.exit(1)
+
+    scenario = load_scenario(scenario_path)
+    with open(log_path, "w") as log:
+        namespace, elapsed, peak = run(scenario, log)
+
+    results = harness.Results()
+    results.lines.append("# scenario {}".format(scenario_path))
+    report(results, namespace, elapsed, peak)
+    results.write(output)
+    print("Results written to", output)
+
+
+main(sys.argv[1:])
@@ -0,0 +1,108 @@
+# Tests that the incremental chart renderer draws the same charts as asciichartpy, which it replaced on the board and
+# which is kept as its reference.
+#
+# Run from the repository root with CPython:
+#   python3 benchmarks/test_chart.py
+import harness
+
+harness.setup()
+
+import random
+from math import isnan
+from asciichartpy import plot_rows
+from chart import ChartGrid
+from history import History
+
+LENGTH = 50
+HEIGHT = 10  # ChartGrid's default
+NAN = float("nan")
+
+
+def axis_maximum(series):
+    """As the service page rounds it."""
+    maximum = max(series) if len(series) != 0 else 1
+    maximum = maximum if not isnan(maximum) else 1
+    return maximum if maximum % 50 == 0 else maximum + 50 - maximum % 50
+
+
+def expected(series, maximum):
+    return list(plot_rows(list(series), minimum=0, maximum=maximum, height=HEIGHT))
+
+
+def drawn(grid):
+    return [bytes(row).decode() for row in grid.rows_out()]
+
+
+def check(grid, series, version, maximum=None):
+    maximum = axis_maximum(series) if maximum is None else maximum
+    grid.update(series, maximum, version)
+    rows = drawn(grid)
+    reference = expected(series, maximum)
+    assert rows == reference, "version {}:\n{}\n-- expected --\n{}".format(version, "\n".join(rows), "\n".join(reference))
+
+
+def test_growing_and_rolling_history():
+    """Samples added one at a time, as checks add them, through a full history that then shifts."""
+    rng = random.Random(1)
+    history = History(LENGTH)
+    grid = ChartGrid(LENGTH)
+    for version in range(1, 4 * LENGTH):
+        roll = rng.random()
+        if roll < 0.1:
+            history.append(NAN)
+        elif roll < 0.15:
+            history.append(rng.uniform(200, 900))  # spikes that move the axis
+        else:
+            history.append(rng.uniform(5, 120))
+        check(grid, history, version)
+
+
+def test_failures_only():
+    history = History(LENGTH)
+    grid = ChartGrid(LENGTH)
+    for version in range(1, 6):
+        history.append(NAN)
+        check(grid, history, version)
+    history.append(42)
+    check(grid, history, 6)
+
+
+def test_flat_and_zero():
+    history = History(LENGTH)
+    grid = ChartGrid(LENGTH)
+    for version in range(1, LENGTH + 5):
+        history.append(0 if version % 7 == 0 else 50)
+        check(grid, history, version)
+
+
+def test_same_version_new_maximum():
+    history = History(LENGTH)
+    grid = ChartGrid(LENGTH)
+    for value in (10, 30, 20, NAN, 45):
+        history.append(value)
+    check(grid, history, 1, 50)
+    check(grid, history, 1, 100)
+
+
+def test_series_shorter_than_before():
+    """A grid drawn for a longer series, as when a rollup resolution restarts after a reboot."""
+    history = History(LENGTH)
+    grid = ChartGrid(LENGTH)
+    for value in range(30):
+        history.append(value * 3)
+    check(grid, history, 1)
+    shorter = History(LENGTH)
+    for value in range(10):
+        shorter.append(value * 3)
+    check(grid, shorter, 2)
+
+
+def main():
+    for name in sorted(globals()):
+        if name.startswith("test_"):
+            globals()[name]()
+            print("ok", name)
+
+
+if __name__ == "__main__":
+    main()
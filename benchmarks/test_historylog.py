@@ -0,0 +1,157 @@
+# Tests that a history log whose flash writes fail drops samples rather than stopping the checks that append them.
+#
+# Run from the repository root with CPython:
+#   python3 benchmarks/test_historylog.py
+import harness
+
+harness.setup()
+
+import builtins
+import time
+import uos
+import uasyncio as asyncio
+import historylog
+from historylog import HistoryLog, RECORD_SIZE, PAGE_SIZE
+from services import Service
+
+DIRECTORY = "test_history"
+PAGE_RECORDS = PAGE_SIZE // RECORD_SIZE
+TIMESTAMP = int(time.time()) - 1000  # within the replay age
+ENOSPC = 28
+
+
+class FailingWrites:
+    """Stands in for open in historylog. While failing is set, segments cannot be opened for appending, or with
+    partial set they open but write only half of the data before failing."""
+
+    def __init__(self):
+        self.failing = False
+        self.partial = False
+        self.failures = 0
+
+    def __call__(self, path, mode="r"):
+        if self.failing and mode == "ab":
+            self.failures += 1
+            if not self.partial:
+                raise OSError(ENOSPC, "ENOSPC")
+            return PartialFile(builtins.open(path, mode))
+        return builtins.open(path, mode)
+
+
+class PartialFile:
+    def __init__(self, file):
+        self.file = file
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.file.close()
+
+    def write(self, data):
+        self.file.write(bytes(data[:len(data) // 2 + 1]))  # not a whole number of records
+        raise OSError(ENOSPC, "ENOSPC")
+
+
+class Target:
+    def __init__(self):
+        self.latencies = []
+
+    def record(self, latency, now):
+        self.latencies.append(latency)
+
+
+def remove_directory():
+    try:
+        for name in uos.listdir(DIRECTORY):
+            uos.remove("{}/{}".format(DIRECTORY, name))
+        uos.rmdir(DIRECTORY)
+    except OSError:
+        pass
+
+
+def create_log(writes):
+    remove_directory()
+    historylog.open = writes
+    return HistoryLog(["service"], directory=DIRECTORY, segment_size=4 * PAGE_SIZE)
+
+
+def finish():
+    del historylog.open
+    remove_directory()
+
+
+def append(log, start, count):
+    for i in range(start, start + count):
+        log.append(0, i % 1000, TIMESTAMP + i)
+
+
+def replay():
+    target = Target()
+    HistoryLog(["service"], directory=DIRECTORY, segment_size=4 * PAGE_SIZE).replay([target])
+    return target.latencies
+
+
+def test_failed_page_flush_is_dropped():
+    writes = FailingWrites()
+    log = create_log(writes)
+    writes.failing = True
+    append(log, 0, 3 * PAGE_RECORDS)  # each page that fills up is flushed from append
+    assert writes.failures == 3
+    assert log.buffered < PAGE_SIZE
+    log.flush()
+    assert log.buffered == 0
+    finish()
+
+
+def test_writes_resume_after_a_failure():
+    for partial in (False, True):
+        writes = FailingWrites()
+        log = create_log(writes)
+        append(log, 0, 10)
+        log.flush()
+        writes.failing = True
+        writes.partial = partial
+        append(log, 10, 10)
+        log.flush()
+        writes.failing = False
+        append(log, 20, 10)
+        log.flush()
+        assert writes.failures == 1
+        # the records of the failed flush are lost, apart from any written whole before it failed, and the records
+        # after it are read back whole rather than misaligned by the torn one
+        lost = range(15, 20) if partial else range(10, 20)
+        assert replay() == [i for i in range(30) if i not in lost], partial
+        finish()
+
+
+def test_check_survives_a_failed_flush():
+    class Online(Service):
+        async def test_service(self):
+            return 5
+
+    writes = FailingWrites()
+    log = create_log(writes)
+    service = Online({"name": "service", "host": "service.test"})
+    service.set_history_log(log, 0)
+    writes.failing = True
+
+    async def check():
+        for _ in range(PAGE_RECORDS + 1):
+            await service.check()
+
+    asyncio.run(check())
+    assert writes.failures == 1
+    assert len(service.get_history()) != 0
+    finish()
+
+
+def main():
+    for name in sorted(globals()):
+        if name.startswith("test_"):
+            globals()[name]()
+            print("ok", name)
+
+
+if __name__ == "__main__":
+    main()
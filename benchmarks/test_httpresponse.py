@@ -0,0 +1,152 @@
+# Tests of the streaming HTTP response reader and keyword matcher used by HTTP checks. Every response is fed through a
+# stream returning at most 1, 3, 7 or all of its bytes per read, so lines, chunk sizes and keywords are split across
+# reads at different places.
+#
+# Run from the repository root with CPython:
+#   python3 benchmarks/test_httpresponse.py
+import harness
+
+harness.setup()
+
+import uasyncio as asyncio
+from httpresponse import ResponseReader, KeywordMatcher
+
+READ_SIZES = (1, 3, 7, None)  # None reads everything at once
+LONG_HEADER = b"X-Padding: " + b"p" * 300 + b"\r\n"  # longer than the reader's buffer
+
+
+class PieceStream:
+    """Stands in for the socket stream, returning at most size bytes per read and 0 at the end."""
+
+    def __init__(self, data, size):
+        self.data = data
+        self.size = size if size is not None else len(data)
+        self.position = 0
+
+    async def readinto(self, buffer):
+        count = min(len(buffer), self.size, len(self.data) - self.position)
+        buffer[:count] = self.data[self.position:self.position + count]
+        self.position += count
+        return count
+
+
+def read(data, keyword=None, limit=4096, to_end=True, sizes=READ_SIZES):
+    """Returns (head parsed, status, reusable, whole body read, keyword found), which must be the same for every read
+    size."""
+    results = []
+    for size in sizes:
+        matcher = KeywordMatcher(keyword) if keyword is not None else None
+        results.append(asyncio.run(_read(PieceStream(data, size), matcher, limit, to_end)))
+    for result in results[1:]:
+        assert result == results[0], (data, results)
+    return results[0]
+
+
+async def _read(stream, matcher, limit, to_end):
+    response = ResponseReader()
+    if not await response.first_byte(stream):
+        return False, None, None, None, None
+    if not await response.read_head(stream):
+        return False, None, None, None, None
+    complete = await response.read_body(stream, matcher, limit, to_end)
+    return True, response.status, response.reusable, complete, matcher.found() if matcher is not None else None
+
+
+def test_content_length():
+    data = b"HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\nContent-Length: 11\r\n\r\nhello world"
+    assert read(data, b"world") == (True, 200, True, True, True)
+    assert read(data, b"planet") == (True, 200, True, True, False)
+    assert read(data) == (True, 200, True, True, None)
+
+
+def test_connection_reuse():
+    assert read(b"HTTP/1.0 200 OK\r\nContent-Length: 0\r\n\r\n")[2] is False  # persistent only from HTTP/1.1
+    assert read(b"HTTP/1.1 200 OK\r\nConnection: Close\r\nContent-Length: 0\r\n\r\n")[2] is False
+    assert read(b"HTTP/1.1 200 OK\r\nconnection: keep-alive\r\ncontent-length: 0\r\n\r\n")[2] is True
+
+
+def test_status_codes():
+    assert read(b"HTTP/1.1 503 Service Unavailable\r\nContent-Length: 4\r\n\r\ndown")[:2] == (True, 503)
+    assert read(b"HTTP/1.1 204 No Content\r\n\r\n", b"x") == (True, 204, True, True, False)  # no body to read
+    assert read(b"HTTP/1.1 304 Not Modified\r\n\r\n") == (True, 304, True, True, None)
+
+
+def test_chunked():
+    data = (b"HTTP/1.1 200 OK\r\nTransfer-Encoding: gzip, Chunked\r\n\r\n"
+            b"5\r\nhello\r\n"
+            b"6;name=value\r\n world\r\n"
+            b"1A\r\n" + b"abcdefghijklmnopqrstuvwxyz" + b"\r\n"
+            b"0\r\nTrailer: value\r\n\r\n")
+    assert read(data, b"lo wor") == (True, 200, True, True, True)  # split between chunks
+    assert read(data, b"xyz") == (True, 200, True, True, True)
+    assert read(data, b"hello world!") == (True, 200, True, True, False)
+    assert read(data + b"HTTP/1.1 200 OK\r\n") == (True, 200, True, True, None)  # stops after the trailers
+
+
+def test_cut_short():
+    assert read(b"HTTP/1.1 200 OK\r\nContent-Length: 20\r\n\r\nonly ten..") == (True, 200, True, False, None)
+    assert read(b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n5\r\nhel")[3] is False
+    assert read(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n")[0] is False  # headers never end
+    assert read(b"")[0] is False
+
+
+def test_malformed():
+    assert read(b"SSH-2.0-OpenSSH_9.6\r\n\r\n")[0] is False
+    assert read(b"HTTP/1.1 OK\r\n\r\n")[0] is False  # no status code
+    assert read(b"HTTP/1.1 200 OK\r\nContent-Length: many\r\n\r\n")[0] is False
+    assert read(b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\nzz\r\n")[3] is False
+
+
+def test_long_header_lines_are_skipped():
+    data = b"HTTP/1.1 200 OK\r\n" + LONG_HEADER + b"Content-Length: 2\r\n" + LONG_HEADER + b"\r\nok"
+    assert read(data, b"ok") == (True, 200, True, True, True)
+    data = b"HTTP/1.1 200 OK\r\n" + LONG_HEADER + b"Connection: close\r\n\r\nok"
+    assert read(data, b"ok") == (True, 200, False, False, True)  # the body runs to the end of the connection
+
+
+def test_body_limit():
+    body = b"a" * 100 + b"needle" + b"b" * 100
+    data = b"HTTP/1.1 200 OK\r\nContent-Length: 206\r\n\r\n" + body
+    assert read(data, b"needle", limit=106) == (True, 200, True, False, True)
+    assert read(data, b"needle", limit=105) == (True, 200, True, False, False)  # the keyword ends past the limit
+    chunked = (b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n"
+               b"64\r\n" + b"a" * 100 + b"\r\n6\r\nneedle\r\n0\r\n\r\n")
+    assert read(chunked, b"needle", limit=106) == (True, 200, True, True, True)
+    assert read(chunked, b"needle", limit=103)[3:] == (False, False)
+
+
+def test_stops_at_keyword_unless_reading_to_end():
+    data = b"HTTP/1.1 200 OK\r\nContent-Length: 13\r\n\r\nfound it here"
+    # reading stops with the read the keyword ends in, which may hold the rest of the body
+    assert read(data, b"found", to_end=False, sizes=(1, 3, 7)) == (True, 200, True, False, True)
+    assert read(data, b"found", to_end=False, sizes=(None,)) == (True, 200, True, True, True)
+    assert read(data, b"found", to_end=True) == (True, 200, True, True, True)
+    # without a matcher, a body with no length is not read, as it ends only when the server closes the connection
+    assert read(b"HTTP/1.0 200 OK\r\n\r\nanything") == (True, 200, False, False, None)
+
+
+def test_keyword_matcher():
+    matcher = KeywordMatcher(b"abab")
+    text = b"xabaabab"
+    for size in (1, 2, 3, len(text)):  # overlapping partial matches, split at each place
+        matcher.reset()
+        for start in range(0, len(text), size):
+            matcher.feed(text, start, min(start + size, len(text)))
+        assert matcher.found(), size
+    matcher = KeywordMatcher(b"aab")
+    assert matcher.feed(b"aaab", 0, 4)  # found only by falling back to the partial match "a", not starting again
+    matcher = KeywordMatcher(b"abab")
+    assert not matcher.feed(b"abaab", 0, 5)
+    assert matcher.feed(b"xxab", 0, 4) is False and not matcher.found()
+    assert matcher.feed(b"ab", 0, 2) and matcher.found()
+
+
+def main():
+    for name in sorted(globals()):
+        if name.startswith("test_"):
+            globals()[name]()
+            print("ok", name)
+
+
+if __name__ == "__main__":
+    main()
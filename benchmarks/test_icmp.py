@@ -0,0 +1,151 @@
+# Tests of the ICMP engine against a loopback stand-in for its raw socket, which answers echo requests itself.
+#
+# Run from the repository root with CPython:
+#   python3 benchmarks/test_icmp.py
+import harness
+
+harness.setup()
+
+import socket
+import uasyncio as asyncio
+from math import isnan
+import icmp
+
+DESTINATION = ("192.0.2.1", 1)
+TIMEOUT = 0.2  # seconds
+
+
+class LoopbackSocket:
+    """Stands in for the raw socket. Echo requests are answered, behind an IP header, through a socket pair whose
+    receiving end the engine's reader waits on, or kept in sent when hold is set and answered with answer()."""
+
+    def __init__(self):
+        self.rx, self.tx = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.rx.setblocking(False)
+        self.sent = []  # every request, oldest first
+        self.hold = False
+
+    def fileno(self):
+        return self.rx.fileno()
+
+    def gettimeout(self):
+        return 0.0
+
+    def recv(self, size):
+        return self.rx.recv(size)
+
+    def sendto(self, packet, destination):
+        assert destination == DESTINATION
+        assert icmp.checksum(packet) == 0, "request checksum does not verify"
+        self.sent.append(bytes(packet))
+        if not self.hold:
+            self.answer(self.sent[-1])
+
+    def answer(self, request, reply_id=None):
+        reply = bytearray(20) + bytearray(request)
+        reply[0] = 0x45  # IPv4, 20 byte header
+        reply[20] = icmp.ECHO_REPLY
+        if reply_id is not None:
+            reply[24] = reply_id >> 8
+            reply[25] = reply_id & 0xFF
+        self.tx.send(reply)
+
+    def close(self):
+        self.rx.close()
+        self.tx.close()
+
+
+def sequence(request):
+    return (request[6] << 8) | request[7]
+
+
+def synchronous(case):
+    """Runs the coroutine function case to completion when called, so pytest and main() can both call the tests."""
+    def run():
+        asyncio.run(case())
+    return run
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+@synchronous
+async def test_reply_is_matched():
+    sock = LoopbackSocket()
+    engine = icmp.ICMPEngine(sock)
+    latency = await engine.ping(DESTINATION, TIMEOUT)
+    assert not isnan(latency) and 0 <= latency < TIMEOUT * 1000, latency
+    assert len(engine.pending) == 0
+    sock.close()
+
+
+@synchronous
+async def test_reply_from_another_identifier_is_ignored():
+    sock = LoopbackSocket()
+    sock.hold = True
+    engine = icmp.ICMPEngine(sock)
+    ping = asyncio.create_task(engine.ping(DESTINATION, TIMEOUT))
+    await settle()
+    sock.answer(sock.sent[0], (engine.id + 1) & 0xFFFF)
+    assert isnan(await ping)
+    assert len(engine.pending) == 0
+    sock.close()
+
+
+@synchronous
+async def test_timeout():
+    sock = LoopbackSocket()
+    sock.hold = True
+    engine = icmp.ICMPEngine(sock)
+    request = engine.create_request()
+    assert isnan(await engine.ping(DESTINATION, TIMEOUT, request))
+    assert len(engine.pending) == 0
+
+    # a late reply is dropped, and the request slot works for the next ping
+    sock.answer(sock.sent[0])
+    sock.hold = False
+    await settle()
+    assert not isnan(await engine.ping(DESTINATION, TIMEOUT, request))
+    sock.close()
+
+
+@synchronous
+async def test_out_of_order_replies():
+    sock = LoopbackSocket()
+    sock.hold = True
+    engine = icmp.ICMPEngine(sock)
+    requests = [engine.create_request() for _ in range(3)]
+    pings = [asyncio.create_task(engine.ping(DESTINATION, TIMEOUT, request)) for request in requests]
+    await settle()
+    assert len(sock.sent) == 3
+    for request in reversed(sock.sent):
+        sock.answer(request)
+    for ping in pings:
+        assert not isnan(await ping)
+    assert len(engine.pending) == 0
+    sock.close()
+
+
+@synchronous
+async def test_sequence_wraps():
+    sock = LoopbackSocket()
+    engine = icmp.ICMPEngine(sock)
+    engine.seq = 0xFFFE
+    for _ in range(3):
+        assert not isnan(await engine.ping(DESTINATION, TIMEOUT))
+    assert [sequence(request) for request in sock.sent] == [0xFFFF, 0, 1]
+    assert len(engine.pending) == 0
+    sock.close()
+
+
+def main():
+    for name in sorted(globals()):
+        if name.startswith("test_"):
+            globals()[name]()
+            print("ok", name)
+
+
+if __name__ == "__main__":
+    main()
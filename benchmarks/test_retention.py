@@ -0,0 +1,82 @@
+# Leak test: warm checks of every service type must not leave memory held by minutePing's own modules, counted by
+# tracemalloc. CPython frees temporary objects as soon as they are unreferenced, so this does not measure how much a
+# check allocates and frees again, which no test covers.
+#
+# Run from the repository root with CPython:
+#   python3 benchmarks/test_retention.py
+import harness
+
+harness.setup()
+
+import gc
+import os
+import tracemalloc
+import resolver
+import servers
+import uasyncio as asyncio
+from services import HTTPService, DNSService, TCPService, UDPService, ICMPService
+
+WARM_CHECKS = 5
+CHECKS = 50
+RETAINED_BYTES_PER_CHECK = 8
+
+
+def create_services():
+    port = {"port": servers.HTTP_PORT}
+    services = [
+        HTTPService(dict(port, name="http", host=servers.HOST + "/status", timeout=2)),
+        HTTPService(dict(port, name="keep_alive", host=servers.HOST + "/status", timeout=2, keep_alive=True)),
+        HTTPService(dict(port, name="keyword", host=servers.HOST + "/status", timeout=2, keyword="ok")),
+        DNSService({"name": "dns", "host": servers.HOST, "port": servers.DNS_PORT, "timeout": 2}),
+        TCPService(dict(port, name="tcp", host=servers.HOST, timeout=2)),
+        UDPService({"name": "udp", "host": servers.HOST, "port": servers.ECHO_PORT, "timeout": 2, "payload": "ping",
+                    "response_prefix": "ping"}),
+    ]
+    import icmp
+    import test_icmp
+
+    icmp.engine = icmp.ICMPEngine(test_icmp.LoopbackSocket())
+    services.append(ICMPService({"name": "icmp", "host": test_icmp.DESTINATION[0], "timeout": 2}))
+    return services
+
+
+async def check(service, count):
+    for _ in range(count):
+        await service.check()
+        latency = service.get_history()[-1]
+        assert latency == latency, "{} check failed".format(service.get_name())  # not NaN
+
+
+async def measure_retained(service):
+    root = os.getcwd()
+    filters = [tracemalloc.Filter(True, os.path.join(root, "*.py")),
+               tracemalloc.Filter(False, os.path.join(root, "benchmarks", "*"))]
+    gc.collect()
+    before = tracemalloc.take_snapshot().filter_traces(filters)
+    await check(service, CHECKS)
+    gc.collect()
+    after = tracemalloc.take_snapshot().filter_traces(filters)
+    return sum(stat.size_diff for stat in after.compare_to(before, "filename")) // CHECKS
+
+
+async def retained_per_check():
+    resolver.server = servers.HOST
+    resolver.port = servers.DNS_PORT
+    servers.start()
+    try:
+        for service in create_services():
+            await check(service, WARM_CHECKS)
+            retained = await measure_retained(service)
+            print("{} retains {} bytes per check".format(service.get_name(), retained))
+            assert retained <= RETAINED_BYTES_PER_CHECK, service.get_name()
+    finally:
+        servers.stop()
+
+
+def test_checks_retain_no_memory():
+    asyncio.run(retained_per_check())
+
+
+if __name__ == "__main__":
+    test_checks_retain_no_memory()
+    print("ok test_checks_retain_no_memory")
@@ -0,0 +1,18 @@
+import gc
+import time
+
+phases = []  # (phase, ticks_ms when it finished, free heap bytes after a collection)
+
+
+def mark(phase):
+    gc.collect()
+    phases.append((phase, time.ticks_ms(), gc.mem_free()))
+    print("Boot phase {} finished at {} ms with {} bytes free".format(*phases[-1]))
+
+
+def report():
+    """Yields one line per phase: name, ms since reset, ms taken, free heap bytes."""
+    previous = 0
+    for phase, ticks, free in phases:
+        yield "{} {} {} {}\n".format(phase, ticks, time.ticks_diff(ticks, previous), free)
+        previous = ticks
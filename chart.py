@@ -0,0 +1,178 @@
+# Incremental renderer of latency charts. The output is identical to asciichartpy.plot_rows with a minimum of 0,
+# for a single series.
+from math import ceil, floor, isnan
+
+SYMBOLS = (b' ', '┼'.encode(), '┤'.encode(), '╶'.encode(), '╴'.encode(), '─'.encode(), '╰'.encode(), '╭'.encode(),
+           '╮'.encode(), '╯'.encode(), '│'.encode())
+SPACE, ZERO_TICK, AXIS, GAP_END, GAP_START, FLAT, UP_FROM, DOWN_TO, DOWN_FROM, UP_TO, VERTICAL = range(11)
+NAN_LEVEL = 255
+
+_line = bytearray(256)  # shared by every grid, holds the row being written out
+
+
+class ChartGrid:
+    """Chart of up to width samples held as one byte per cell, the index of the symbol drawn there.
+
+    update() redraws only the columns whose two samples moved to a different level. When the series has shifted by
+    one sample, as a full History does for every check, the grid is shifted and only the newest column is drawn.
+    Everything is redrawn when the axis maximum changes.
+    """
+
+    def __init__(self, width, height=10, offset=3, label_format="{:5.0f}"):
+        self.width = width
+        self.height = height
+        self.offset = offset
+        self.label_format = label_format
+        self.cells = bytearray((height + 2) * width)  # rows can exceed height by one after rounding
+        self.levels = bytearray(width)  # scaled value of each sample, NAN_LEVEL for failures
+        self.new_levels = bytearray(width)
+        self.count = 0  # samples drawn
+        self.numbers = 0  # samples drawn that are not NaN
+        self.maximum = None
+        self.rows = 0
+        self.ratio = 1
+        self.labels = []  # label and axis of each row, as bytes without the axis symbol
+        self.version = None
+        self.streaming = 0  # rows_out generators not yet finished, during which the grid must not change
+
+    def __len__(self):
+        return len(self.cells) + 2 * self.width
+
+    def get_version(self):
+        return self.version
+
+    def is_streaming(self):
+        return self.streaming > 0
+
+    def _scale(self, maximum):
+        self.maximum = maximum
+        self.ratio = self.height / maximum if maximum > 0 else 1
+        self.rows = int(ceil(maximum * self.ratio)) - int(floor(0 * self.ratio))
+        self.labels = []
+        for r in range(self.rows + 1):
+            label = self.label_format.format(maximum - (r * maximum / (self.rows if self.rows else 1))).encode()
+            label_cell = max(self.offset - len(label), 0)
+            if label_cell < self.offset - 1:
+                label = b' ' * label_cell + label + b' ' * (self.offset - 2 - label_cell)
+            else:
+                label = b' ' * (self.offset - 1)  # the axis overwrites the label
+            self.labels.append(label)
+
+    def _level(self, value):
+        if isnan(value):
+            return NAN_LEVEL
+        return int(round(min(max(value, 0), self.maximum) * self.ratio))
+
+    def _draw(self, x, l0, l1):
+        cells = self.cells
+        width = self.width
+        for r in range(self.rows + 1):
+            level = self.rows - r
+            symbol = SPACE
+            if l0 == NAN_LEVEL and l1 == NAN_LEVEL:
+                pass
+            elif l0 == NAN_LEVEL:
+                if l1 == level:
+                    symbol = GAP_END
+            elif l1 == NAN_LEVEL:
+                if l0 == level:
+                    symbol = GAP_START
+            elif l0 == l1:
+                if l0 == level:
+                    symbol = FLAT
+            elif l0 == level:
+                symbol = DOWN_FROM if l0 > l1 else UP_TO
+            elif l1 == level:
+                symbol = UP_FROM if l0 > l1 else DOWN_TO
+            elif min(l0, l1) < level < max(l0, l1):
+                symbol = VERTICAL
+            cells[r * width + x] = symbol
+
+    def _clear(self, x):
+        for r in range(self.rows + 1):
+            self.cells[r * self.width + x] = SPACE
+
+    def _shift(self):
+        cells = self.cells
+        for r in range(self.rows + 1):
+            start = r * self.width
+            for i in range(start, start + self.count - 2):  # left to right, so nothing is overwritten before it moves
+                cells[i] = cells[i + 1]
+
+    def update(self, series, maximum, version):
+        """Brings the grid up to date with series, plotted from 0 to maximum. Not allowed while is_streaming()."""
+        if version == self.version and maximum == self.maximum:
+            return
+
+        old = self.levels
+        new = self.new_levels
+        redraw = maximum != self.maximum
+        if redraw:
+            self._scale(maximum)
+        count = min(len(series), self.width)
+        self.numbers = 0
+        for i in range(count):
+            new[i] = self._level(series[i])
+            if new[i] != NAN_LEVEL:
+                self.numbers += 1
+
+        if redraw:
+            for i in range(len(self.cells)):
+                self.cells[i] = SPACE
+            for x in range(count - 1):
+                self._draw(x, new[x], new[x + 1])
+        else:
+            shifted = count == self.count and count > 2
+            for i in range(count - 1 if shifted else 0):
+                if new[i] != old[i + 1]:
+                    shifted = False
+                    break
+            if shifted:
+                self._shift()
+                self._draw(count - 2, new[count - 2], new[count - 1])
+            else:
+                for x in range(count - 1):
+                    if x >= self.count - 1 or new[x] != old[x] or new[x + 1] != old[x + 1]:
+                        self._draw(x, new[x], new[x + 1])
+                for x in range(max(count - 1, 0), self.count - 1):
+                    self._clear(x)
+
+        self.levels = new
+        self.new_levels = old
+        self.count = count
+        self.version = version
+
+    def rows_out(self):
+        """Yields each row as UTF-8 without a line ending. The memoryview is reused, so write it before the next.
+
+        The caller may wait between rows, and is_streaming() is true until the generator finishes.
+        """
+        global _line
+        if self.count == 0 or self.numbers == 0:
+            return
+        if len(_line) < 16 + 3 * (self.offset + self.width):  # every symbol but the space is 3 bytes
+            _line = bytearray(16 + 3 * (self.offset + self.width))
+
+        line = _line
+        cells = self.cells
+        first_tick = self.rows - self.levels[0] if self.levels[0] != NAN_LEVEL else -1
+        self.streaming += 1
+        try:
+            for r in range(self.rows + 1):
+                label = self.labels[r]
+                end = len(label)
+                line[:end] = label
+                line[end:end + 3] = SYMBOLS[ZERO_TICK if r == 0 or r == first_tick else AXIS]
+                end += 3
+
+                base = r * self.width
+                last = base + self.count - 2  # the last cell holding a symbol, trailing spaces are left out
+                while last >= base and cells[last] == SPACE:
+                    last -= 1
+                for i in range(base, last + 1):
+                    symbol = SYMBOLS[cells[i]]
+                    line[end:end + len(symbol)] = symbol
+                    end += len(symbol)
+                yield memoryview(line)[:end]
+        finally:
+            self.streaming -= 1
@@ -0,0 +1,79 @@
+import machine
+import ntptime
+import time
+import uasyncio as asyncio
+
+sync_interval = 3600  # seconds, must stay well within half the ticks_ms period
+retry_interval = 60
+MAX_AGE = 432000  # seconds without a sync before falling back to the RTC
+MAX_DRIFT = 0.01
+
+synced_ms = None  # ms since 2000-01-01 UTC at the last sync
+synced_ticks = 0  # ticks_ms at the last sync
+synced_rtc = 0  # time.time() just after the last sync
+drift = 0.0  # fraction the ticks_ms clock runs slow (positive) or fast (negative)
+round_trip = None  # ms, of the last sync
+syncs = 0
+
+
+def now_ms():
+    """Milliseconds since 2000-01-01 UTC, from the last NTP sync without any network I/O."""
+    if synced_ms is None or time.time() - synced_rtc > MAX_AGE:
+        return time.time() * 1000
+    elapsed = time.ticks_diff(time.ticks_ms(), synced_ticks)
+    return synced_ms + int(elapsed * (1 + drift))
+
+
+def now():
+    return now_ms() // 1000
+
+
+def datetime():
+    """(year, month, day, hour, minute, second, weekday, yearday) in UTC."""
+    return time.gmtime(now())
+
+
+def get_sync_age():
+    """Seconds since the last successful sync, or None if the clock has never been synced."""
+    if synced_ms is None:
+        return None
+    return time.ticks_diff(time.ticks_ms(), synced_ticks) // 1000
+
+
+def get_round_trip():
+    return round_trip
+
+
+def get_syncs():
+    return syncs
+
+
+async def sync():
+    global synced_ms, synced_ticks, synced_rtc, drift, round_trip, syncs
+
+    utc_ms, sync_round_trip = await asyncio.wait_for(ntptime.query(), 5)
+    ticks = time.ticks_ms()
+
+    if synced_ms is not None:
+        elapsed = time.ticks_diff(ticks, synced_ticks)
+        if elapsed > 600000:  # too short an interval is dominated by round trip jitter
+            drift = min(max((utc_ms - synced_ms - elapsed) / elapsed, -MAX_DRIFT), MAX_DRIFT)
+
+    synced_ms = utc_ms
+    synced_ticks = ticks
+    round_trip = sync_round_trip
+    syncs += 1
+
+    tm = time.gmtime(utc_ms // 1000)
+    machine.RTC().datetime((tm[0], tm[1], tm[2], tm[6] + 1, tm[3], tm[4], tm[5], 0))
+    synced_rtc = time.time()
+
+
+async def run():
+    while True:
+        try:
+            await sync()
+            await asyncio.sleep(sync_interval)
+        except (OSError, asyncio.TimeoutError) as e:
+            print("NTP sync failed: " + str(e))
+            await asyncio.sleep(retry_interval)
@@ -0,0 +1,91 @@
+from json import load, loads, dumps
+import gc
+import ubinascii
+import uhashlib
+import uos
+
+SERVICE_TYPES = ["icmp", "http", "dns", "tcp", "udp"]
+NOTIFIER_TYPES = ["email"]
+
+
+def fingerprint(path):
+    """Size and SHA-256 of the file, read in small chunks so the whole file is never in memory."""
+    digest = uhashlib.sha256()
+    chunk = bytearray(256)
+    with open(path, "rb") as config_file:
+        while True:
+            length = config_file.readinto(chunk)
+            if not length:
+                break
+            digest.update(memoryview(chunk)[:length])
+    return "{}:{}".format(uos.stat(path)[6], ubinascii.hexlify(digest.digest()).decode())
+
+
+def compile_config(path, cache_path, config_fingerprint):
+    """Validates the JSON configuration and writes it as one small JSON record per line.
+
+    The first line holds the fingerprint of the source file, the second the top level settings, followed by one
+    line per notifier and then one per service.
+    """
+    with open(path, "r") as config_file:
+        config = load(config_file)
+
+    for notifier_config in config["notifiers"]:
+        if notifier_config["type"] not in NOTIFIER_TYPES:
+            raise ValueError("Notifier configuration is of invalid type {}".format(notifier_config["type"]))
+    for service_config in config["services"]:
+        if service_config["type"] not in SERVICE_TYPES:
+            raise ValueError("Service configuration {} is of invalid type {}".format(service_config["name"],
+                                                                                    service_config["type"]))
+
+    with open(cache_path + ".tmp", "w") as cache:
+        cache.write(config_fingerprint + "\n")
+        notifiers = config.pop("notifiers")
+        services = config.pop("services")
+        cache.write(dumps(config) + "\n")
+        for notifier_config in notifiers:
+            cache.write(dumps(["notifier", notifier_config]) + "\n")
+        for service_config in services:
+            cache.write(dumps(["service", service_config]) + "\n")
+    try:
+        uos.remove(cache_path)
+    except OSError:
+        pass
+    uos.rename(cache_path + ".tmp", cache_path)
+
+
+def _records(cache):
+    try:
+        while True:
+            line = cache.readline()
+            if not line:
+                break
+            yield loads(line)
+    finally:
+        cache.close()
+
+
+def _open(cache_path, config_fingerprint):
+    try:
+        cache = open(cache_path, "r")
+    except OSError:
+        return None
+    if cache.readline().rstrip("\n") != config_fingerprint:
+        cache.close()
+        return None
+    return loads(cache.readline()), _records(cache)
+
+
+def load_config(path="config.json", cache_path="config.cache"):
+    """Returns (settings, records) where records yields [kind, config] for each notifier, then each service.
+
+    The cache is rebuilt from path whenever its fingerprint changes.
+    """
+    config_fingerprint = fingerprint(path)
+    cached = _open(cache_path, config_fingerprint)
+    if cached is None:
+        print("Compiling configuration...")
+        compile_config(path, cache_path, config_fingerprint)
+        gc.collect()
+        cached = _open(cache_path, config_fingerprint)
+    return cached
@@ -0,0 +1,338 @@
+from array import array
+from math import isnan
+from time import ticks_add, ticks_diff
+
+NAN = float("nan")
+
+
+class History:
+    """Fixed-size circular buffer of latency samples. Failed checks are stored as NaN."""
+
+    def __init__(self, length):
+        self.length = length
+        self.samples = array('f', bytes(4 * length))  # preallocated, never resized
+        self.cursor = 0  # index of the next write
+        self.count = 0
+
+    def append(self, latency):
+        self.samples[self.cursor] = latency
+        self.cursor += 1
+        if self.cursor == self.length:
+            self.cursor = 0
+        if self.count < self.length:
+            self.count += 1
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        if index < 0 or index >= self.count:
+            raise IndexError("history index out of range")
+        index += self.cursor - self.count
+        if index < 0:
+            index += self.length
+        return self.samples[index]
+
+    def __iter__(self):  # oldest to newest
+        index = self.cursor - self.count
+        if index < 0:
+            index += self.length
+        for _ in range(self.count):
+            yield self.samples[index]
+            index += 1
+            if index == self.length:
+                index = 0
+
+
+# name, seconds per bucket, number of buckets
+ROLLUP_RESOLUTIONS = (("minute", 60, 60), ("hour", 3600, 48), ("day", 86400, 14))
+
+
+class Rollup:
+    """Fixed-size circular buffer of time buckets summarising latency samples.
+
+    Buckets are advanced with ticks_diff so they are unaffected by the RTC being set by NTP.
+    Indexing and iteration yield the mean latency of each bucket, oldest first, so a Rollup can be
+    plotted in the same way as a History.
+    """
+
+    def __init__(self, period, length):
+        self.period = period
+        self.length = length
+        self.counts = array('H', bytes(2 * length))
+        self.failures = array('H', bytes(2 * length))
+        self.minimums = array('f', bytes(4 * length))
+        self.maximums = array('f', bytes(4 * length))
+        self.sums = array('f', bytes(4 * length))
+        self.cursor = 0  # index of the current bucket
+        self.count = 0
+        self.bucket_start = 0  # ticks_ms at which the current bucket began
+
+    def add(self, now, latency):
+        if self.count == 0:
+            self.count = 1
+            self.bucket_start = now
+        else:
+            steps = ticks_diff(now, self.bucket_start) // (self.period * 1000)
+            if steps > 0:
+                self.bucket_start = ticks_add(self.bucket_start, steps * self.period * 1000)
+                for _ in range(min(steps, self.length)):
+                    self.cursor += 1
+                    if self.cursor == self.length:
+                        self.cursor = 0
+                    self.counts[self.cursor] = 0
+                    self.failures[self.cursor] = 0
+                    self.sums[self.cursor] = 0
+                    if self.count < self.length:
+                        self.count += 1
+
+        i = self.cursor
+        if self.counts[i] == 0xFFFF:
+            return
+        self.counts[i] += 1
+
+        if isnan(latency):
+            self.failures[i] += 1
+        elif self.counts[i] - self.failures[i] == 1:
+            self.minimums[i] = latency
+            self.maximums[i] = latency
+            self.sums[i] = latency
+        else:
+            if latency < self.minimums[i]:
+                self.minimums[i] = latency
+            if latency > self.maximums[i]:
+                self.maximums[i] = latency
+            self.sums[i] += latency
+
+    def _index(self, index):
+        if index < 0:
+            index += self.count
+        if index < 0 or index >= self.count:
+            raise IndexError("rollup index out of range")
+        index += self.cursor + 1 - self.count
+        if index < 0:
+            index += self.length
+        return index
+
+    def _mean(self, i):
+        successes = self.counts[i] - self.failures[i]
+        return self.sums[i] / successes if successes else NAN
+
+    def get_bucket(self, index):
+        i = self._index(index)
+        if self.counts[i] == self.failures[i]:
+            return self.counts[i], self.failures[i], NAN, NAN, NAN
+        return self.counts[i], self.failures[i], self.minimums[i], self._mean(i), self.maximums[i]
+
+    def summary(self):
+        """Returns (count, failures, minimum, mean, maximum) over every bucket held."""
+        count = failures = 0
+        minimum = maximum = NAN
+        total = 0.0
+        for index in range(self.count):
+            bucket_count, bucket_failures, bucket_minimum, _, bucket_maximum = self.get_bucket(index)
+            count += bucket_count
+            failures += bucket_failures
+            if not isnan(bucket_minimum):
+                total += self.sums[self._index(index)]
+                minimum = bucket_minimum if isnan(minimum) else min(minimum, bucket_minimum)
+                maximum = bucket_maximum if isnan(maximum) else max(maximum, bucket_maximum)
+        mean = total / (count - failures) if count != failures else NAN
+        return count, failures, minimum, mean, maximum
+
+    def get_period(self):
+        return self.period
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        return self._mean(self._index(index))
+
+    def __iter__(self):  # oldest to newest
+        for index in range(self.count):
+            yield self[index]
+
+
+MISSING = 0xFFFF  # phase not reached because the check failed before it
+
+
+class PhaseHistory:
+    """Fixed-size circular buffer of the duration of each phase of a check, in whole ms.
+
+    Each entry holds one unsigned 16 bit value per phase, so a check costs 2 bytes per phase.
+    Phases the check did not complete are stored as MISSING.
+    """
+
+    def __init__(self, length, phases):
+        self.length = length
+        self.phases = phases  # names, in the order values are stored
+        self.width = len(phases)
+        self.samples = array('H', bytes(2 * length * self.width))
+        self.cursor = 0  # index of the next write
+        self.count = 0
+
+    def append(self, values):
+        """Copies values, one per phase, into the buffer. Values above 65534 ms are clamped."""
+        base = self.cursor * self.width
+        for phase in range(self.width):
+            self.samples[base + phase] = min(values[phase], MISSING)
+        self.cursor += 1
+        if self.cursor == self.length:
+            self.cursor = 0
+        if self.count < self.length:
+            self.count += 1
+
+    def get_phases(self):
+        return self.phases
+
+    def _index(self, index):
+        if index < 0:
+            index += self.count
+        if index < 0 or index >= self.count:
+            raise IndexError("phase history index out of range")
+        index += self.cursor - self.count
+        if index < 0:
+            index += self.length
+        return index
+
+    def get(self, index, phase):
+        """Duration of phase in the check at index (oldest first, negative from the newest), NaN if missing."""
+        value = self.samples[self._index(index) * self.width + phase]
+        return NAN if value == MISSING else value
+
+    def mean(self, phase):
+        """Mean duration of phase over the checks that completed it, NaN if none did."""
+        total = successes = 0
+        for index in range(self.count):
+            value = self.samples[index * self.width + phase]
+            if value != MISSING:
+                total += value
+                successes += 1
+        return total / successes if successes else NAN
+
+    def __len__(self):
+        return self.count
+
+
+# seconds covered by each uptime ratio. Set from the uptime_windows setting before services are created
+uptime_windows = (3600, 86400, 604800)
+UPTIME_BUCKETS = 12  # an uptime window covers between 11/12 and all of its period
+
+# upper bounds in ms of the latency histogram buckets, followed by one open bucket for anything slower
+HISTOGRAM_BOUNDS = (1, 2, 3, 5, 7, 10, 15, 20, 30, 50, 70, 100, 150, 200, 300, 500, 700, 1000, 1500, 2000, 3000, 5000)
+HISTOGRAM_LIMIT = 4096  # samples held before every count is halved, so percentiles follow recent latency
+EWMA_WEIGHT = 0.1
+JITTER_WEIGHT = 1 / 16  # as for RTP interarrival jitter
+
+
+class UptimeWindow:
+    """Checks and failures over roughly the last period seconds, as time buckets with running totals."""
+
+    def __init__(self, period):
+        self.period = period
+        self.bucket_length = period * 1000 // UPTIME_BUCKETS  # ms
+        self.checks = array('I', bytes(4 * UPTIME_BUCKETS))
+        self.failures = array('I', bytes(4 * UPTIME_BUCKETS))
+        self.total_checks = 0
+        self.total_failures = 0
+        self.cursor = 0
+        self.bucket_start = None  # ticks_ms at which the current bucket began
+
+    def add(self, now, failed):
+        if self.bucket_start is None:
+            self.bucket_start = now
+        else:
+            steps = ticks_diff(now, self.bucket_start) // self.bucket_length
+            if steps > 0:
+                self.bucket_start = ticks_add(self.bucket_start, steps * self.bucket_length)
+                for _ in range(min(steps, UPTIME_BUCKETS)):
+                    self.cursor += 1
+                    if self.cursor == UPTIME_BUCKETS:
+                        self.cursor = 0
+                    self.total_checks -= self.checks[self.cursor]
+                    self.total_failures -= self.failures[self.cursor]
+                    self.checks[self.cursor] = 0
+                    self.failures[self.cursor] = 0
+
+        self.checks[self.cursor] += 1
+        self.total_checks += 1
+        if failed:
+            self.failures[self.cursor] += 1
+            self.total_failures += 1
+
+    def get_period(self):
+        return self.period
+
+    def ratio(self):
+        """Fraction of checks in the window that succeeded, NaN if there were none."""
+        if self.total_checks == 0:
+            return NAN
+        return (self.total_checks - self.total_failures) / self.total_checks
+
+
+class Statistics:
+    """Latency and uptime statistics updated in constant time per sample and read without a pass over the history.
+
+    Percentiles are estimated from a fixed bucket histogram, interpolating within the bucket.
+    """
+
+    def __init__(self, windows=None):
+        self.windows = [UptimeWindow(period) for period in (uptime_windows if windows is None else windows)]
+        self.histogram = array('H', bytes(2 * (len(HISTOGRAM_BOUNDS) + 1)))
+        self.histogram_count = 0
+        self.ewma = NAN
+        self.jitter = 0.0
+        self.last = NAN  # latency of the most recent successful check
+
+    def add(self, now, latency):
+        failed = isnan(latency)
+        for window in self.windows:
+            window.add(now, failed)
+        if failed:
+            return
+
+        if isnan(self.last):
+            self.ewma = latency
+        else:
+            self.ewma += EWMA_WEIGHT * (latency - self.ewma)
+            self.jitter += JITTER_WEIGHT * (abs(latency - self.last) - self.jitter)
+        self.last = latency
+
+        if self.histogram_count == HISTOGRAM_LIMIT:
+            self.histogram_count = 0
+            for bucket in range(len(self.histogram)):
+                self.histogram[bucket] >>= 1
+                self.histogram_count += self.histogram[bucket]
+        bucket = 0
+        while bucket < len(HISTOGRAM_BOUNDS) and latency > HISTOGRAM_BOUNDS[bucket]:
+            bucket += 1
+        self.histogram[bucket] += 1
+        self.histogram_count += 1
+
+    def get_windows(self):
+        return self.windows
+
+    def get_ewma(self):
+        return self.ewma
+
+    def get_jitter(self):
+        return self.jitter if not isnan(self.last) else NAN
+
+    def percentile(self, percent):
+        """Approximate latency below which percent of recent successful checks fell, NaN if there were none."""
+        if self.histogram_count == 0:
+            return NAN
+        target = self.histogram_count * percent / 100
+        seen = 0
+        for bucket in range(len(self.histogram)):
+            count = self.histogram[bucket]
+            if count and seen + count >= target:
+                if bucket == len(HISTOGRAM_BOUNDS):
+                    return HISTOGRAM_BOUNDS[-1]  # only known to be slower than the last bound
+                lower = HISTOGRAM_BOUNDS[bucket - 1] if bucket else 0
+                return lower + (HISTOGRAM_BOUNDS[bucket] - lower) * (target - seen) / count
+            seen += count
+        return HISTOGRAM_BOUNDS[-1]
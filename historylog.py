@@ -0,0 +1,168 @@
+from math import isnan
+import time
+import ustruct
+import uos
+import uasyncio as asyncio
+
+# timestamp (seconds since epoch), service index, latency in ms (FAILED for failed checks)
+RECORD_FORMAT = "<IHH"
+RECORD_SIZE = ustruct.calcsize(RECORD_FORMAT)
+FAILED = 0xFFFF
+PAGE_SIZE = 4096  # flash sector size, records are written in batches of at most this many bytes
+MAX_REPLAY_AGE = 432000  # seconds, must stay within half the ticks_ms period
+
+
+class HistoryLog:
+    """Append-only binary log of latency samples kept in rotating segment files.
+
+    Samples are buffered in RAM and written a page at a time (or every flush_interval seconds) to limit flash
+    wear. At boot the segments are streamed back through replay() to rebuild each service's history.
+    """
+
+    def __init__(self, service_names, directory="history", segment_size=16384, segments=4, flush_interval=600):
+        self.directory = directory
+        self.segment_size = segment_size - segment_size % PAGE_SIZE if segment_size >= PAGE_SIZE else PAGE_SIZE
+        self.segments = segments
+        self.flush_interval = flush_interval
+
+        self.buffer = bytearray(PAGE_SIZE)
+        self.buffered = 0  # bytes of self.buffer in use
+
+        try:
+            uos.mkdir(directory)
+        except OSError:
+            pass  # already exists
+
+        # records are stored by service index, so a log written with a different list of services is discarded
+        services_id = ",".join(service_names)
+        try:
+            with open(self._path("services"), "r") as services_file:
+                valid = services_file.read() == services_id
+        except OSError:
+            valid = False
+
+        self.sequences = self._list_sequences()
+        if not valid:
+            for sequence in self.sequences:
+                uos.remove(self._segment_path(sequence))
+            self.sequences = []
+            with open(self._path("services"), "w") as services_file:
+                services_file.write(services_id)
+
+        if len(self.sequences) == 0:
+            self.sequence = 0
+            self.segment_bytes = 0
+        else:
+            self.sequence = self.sequences[-1]
+            self.segment_bytes = uos.stat(self._segment_path(self.sequence))[6]
+            if self.segment_bytes % RECORD_SIZE != 0:  # torn write, keep following records aligned
+                self.sequence += 1
+                self.segment_bytes = 0
+
+    def _path(self, name):
+        return "{}/{}".format(self.directory, name)
+
+    def _segment_path(self, sequence):
+        return self._path("{}.log".format(sequence))
+
+    def _list_sequences(self):
+        sequences = []
+        for name in uos.listdir(self.directory):
+            if name.endswith(".log"):
+                try:
+                    sequences.append(int(name[:-4]))
+                except ValueError:
+                    pass
+        sequences.sort()
+        return sequences
+
+    def append(self, service_index, latency, timestamp=None):
+        if timestamp is None:
+            timestamp = int(time.time())
+        if isnan(latency):
+            latency = FAILED
+        else:
+            latency = min(int(latency), FAILED - 1)
+
+        ustruct.pack_into(RECORD_FORMAT, self.buffer, self.buffered, timestamp, service_index, latency)
+        self.buffered += RECORD_SIZE
+
+        if self.buffered + RECORD_SIZE > PAGE_SIZE:
+            self.flush()
+
+    def flush(self):
+        """Writes the buffered records. Write errors are printed, and the records are then lost."""
+        if self.buffered == 0:
+            return
+
+        if self.segment_bytes + self.buffered > self.segment_size:
+            self.sequence += 1
+            self.segment_bytes = 0
+            expired = self.sequence - self.segments
+            while len(self.sequences) != 0 and self.sequences[0] <= expired:
+                try:
+                    uos.remove(self._segment_path(self.sequences.pop(0)))
+                except OSError:
+                    pass
+
+        try:
+            with open(self._segment_path(self.sequence), "ab") as segment:
+                segment.write(memoryview(self.buffer)[:self.buffered])
+        except OSError as e:  # a full or failing filesystem must not stop the checks that append
+            print("Failed to write history log: " + str(e))
+            # the samples are dropped. Part of them may have been written, so later ones start a new segment
+            self.buffered = 0
+            self.sequence += 1
+            self.segment_bytes = 0
+            return
+        if len(self.sequences) == 0 or self.sequences[-1] != self.sequence:
+            self.sequences.append(self.sequence)
+
+        self.segment_bytes += self.buffered
+        self.buffered = 0
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.flush()
+
+    def records(self):
+        """Yields (timestamp, service_index, latency) for every record on flash, oldest first."""
+        chunk = bytearray(RECORD_SIZE * 64)
+        for sequence in self.sequences:
+            with open(self._segment_path(sequence), "rb") as segment:
+                while True:
+                    length = segment.readinto(chunk)
+                    if not length:
+                        break
+                    for offset in range(0, length - length % RECORD_SIZE, RECORD_SIZE):
+                        timestamp, service_index, latency = ustruct.unpack_from(RECORD_FORMAT, chunk, offset)
+                        yield timestamp, service_index, float("nan") if latency == FAILED else latency
+
+    def newest_timestamp(self):
+        if len(self.sequences) == 0:
+            return None
+        path = self._segment_path(self.sequences[-1])
+        size = uos.stat(path)[6]
+        if size < RECORD_SIZE:
+            return None
+        with open(path, "rb") as segment:
+            segment.seek(size - size % RECORD_SIZE - RECORD_SIZE)
+            return ustruct.unpack(RECORD_FORMAT, segment.read(RECORD_SIZE))[0]
+
+    def replay(self, services):
+        """Streams the log into each service's history. Returns the number of records replayed."""
+        newest = self.newest_timestamp()
+        if newest is None:
+            return 0
+
+        # maps record timestamps onto ticks_ms so rollups see the original spacing between samples.
+        # the RTC may not be set yet after a power loss, in which case the newest record is treated as now
+        reference = max(int(time.time()), newest)
+        now = time.ticks_ms()
+        replayed = 0
+        for timestamp, service_index, latency in self.records():
+            if service_index < len(services) and 0 <= reference - timestamp < MAX_REPLAY_AGE:
+                services[service_index].record(latency, time.ticks_add(now, (timestamp - reference) * 1000))
+                replayed += 1
+        return replayed
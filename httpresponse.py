@@ -0,0 +1,233 @@
+# Streaming reader of HTTP responses for HTTP checks. Responses are read through one preallocated buffer per service,
+# so a check needs the same memory whatever the size of the page.
+from array import array
+
+LF = 10
+CR = 13
+
+
+def _lower(byte):
+    return byte | 0x20 if 65 <= byte <= 90 else byte
+
+
+class KeywordMatcher:
+    """Knuth-Morris-Pratt search for a keyword in a stream of bytes fed in pieces of any size.
+
+    Memory is fixed by the length of the keyword, and matches split between pieces are found.
+    """
+
+    def __init__(self, keyword):
+        self.keyword = keyword
+        self.table = array('H', bytes(2 * len(keyword)))  # longest proper prefix of keyword[:i + 1] that is a suffix
+        matched = 0
+        for i in range(1, len(keyword)):
+            while matched > 0 and keyword[i] != keyword[matched]:
+                matched = self.table[matched - 1]
+            if keyword[i] == keyword[matched]:
+                matched += 1
+            self.table[i] = matched
+        self.matched = 0  # bytes of the keyword matched so far
+
+    def reset(self):
+        self.matched = 0
+
+    def found(self):
+        return self.matched == len(self.keyword)
+
+    def feed(self, data, start, end):
+        """Searches data[start:end], continuing from earlier pieces. Returns True once the keyword has been seen."""
+        keyword = self.keyword
+        table = self.table
+        length = len(keyword)
+        matched = self.matched
+        if matched == length:
+            return True
+        for i in range(start, end):
+            byte = data[i]
+            while matched > 0 and byte != keyword[matched]:
+                matched = table[matched - 1]
+            if byte == keyword[matched]:
+                matched += 1
+                if matched == length:
+                    break
+        self.matched = matched
+        return matched == length
+
+
+class ResponseReader:
+    """Parses the status line and headers of a response and reads its body, through a buffer of size bytes.
+
+    Header lines longer than the buffer are skipped, as none of those used are that long.
+    """
+
+    def __init__(self, size=128):
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.start = 0  # first byte not yet parsed
+        self.end = 0  # end of the bytes read
+        self.status = 0
+        self.length = -1  # Content-Length, -1 if not given
+        self.chunked = False
+        self.reusable = False  # whether the connection can carry another request after this response
+
+    async def first_byte(self, reader):
+        """Starts a new response and waits for its first bytes. Returns False if the connection was closed."""
+        self.start = 0
+        self.end = 0
+        return await self._fill(reader)
+
+    async def _fill(self, reader):
+        """Moves unparsed bytes to the front of the buffer and reads more after them. Returns False at the end."""
+        buffer = self.buffer
+        if self.start != 0:
+            remaining = self.end - self.start
+            for i in range(remaining):
+                buffer[i] = buffer[self.start + i]
+            self.start = 0
+            self.end = remaining
+        count = await reader.readinto(self.view[self.end:])
+        if not count:
+            return False
+        self.end += count
+        return True
+
+    async def _line(self, reader):
+        """Returns the start and end in the buffer of the next line without its line ending, or None at the end."""
+        buffer = self.buffer
+        skipping = False
+        i = self.start
+        while True:
+            while i < self.end:
+                if buffer[i] == LF:
+                    start = self.start
+                    self.start = i + 1
+                    if not skipping:
+                        return start, i - 1 if i > start and buffer[i - 1] == CR else i
+                    skipping = False
+                i += 1
+            if self.start == 0 and self.end == len(buffer):  # the line does not fit
+                self.end = 0
+                skipping = True
+            i = self.end - self.start
+            if not await self._fill(reader):
+                return None
+
+    def _starts_with(self, start, end, prefix):
+        """Case insensitive comparison, prefix is lower case."""
+        if end - start < len(prefix):
+            return False
+        for i in range(len(prefix)):
+            if _lower(self.buffer[start + i]) != prefix[i]:
+                return False
+        return True
+
+    def _contains(self, start, end, word):
+        """Case insensitive search, word is lower case."""
+        for i in range(start, end - len(word) + 1):
+            if self._starts_with(i, end, word):
+                return True
+        return False
+
+    def _number(self, start, end, base):
+        """Parses the number after any spaces, up to the first byte that is not a digit. Returns -1 if there is none."""
+        buffer = self.buffer
+        while start < end and (buffer[start] == 32 or buffer[start] == 9):
+            start += 1
+        value = -1
+        while start < end:
+            byte = _lower(buffer[start])
+            if 48 <= byte <= 57:
+                digit = byte - 48
+            elif base == 16 and 97 <= byte <= 102:
+                digit = byte - 87
+            else:
+                break
+            value = (0 if value < 0 else value * base) + digit
+            start += 1
+        return value
+
+    async def read_head(self, reader):
+        """Parses the status line and headers. Returns False if the response is malformed or cut short."""
+        line = await self._line(reader)
+        if line is None or not self._starts_with(line[0], line[1], b"http/1.") or line[1] - line[0] < 12:
+            return False
+        start, end = line
+        self.reusable = self.buffer[start + 7] == 49  # persistent by default from HTTP/1.1
+        self.status = self._number(start + 8, end, 10)
+        if self.status < 0:
+            return False
+
+        self.length = -1
+        self.chunked = False
+        while True:
+            line = await self._line(reader)
+            if line is None:
+                return False
+            start, end = line
+            if start == end:
+                return True
+            if self._starts_with(start, end, b"content-length:"):
+                self.length = self._number(start + 15, end, 10)
+                if self.length < 0:
+                    return False
+            elif self._starts_with(start, end, b"transfer-encoding:"):
+                self.chunked = self._contains(start + 18, end, b"chunked")
+            elif self._starts_with(start, end, b"connection:"):
+                if self._contains(start + 11, end, b"close"):
+                    self.reusable = False
+
+    async def read_body(self, reader, matcher=None, limit=4096, to_end=False):
+        """Reads up to limit bytes of the body, feeding them to matcher.
+
+        Reading stops once matcher has found its keyword, unless to_end is set. Returns whether the whole body was
+        read, so the connection can carry another request.
+        """
+        if self.status < 200 or self.status == 204 or self.status == 304:
+            return True  # no body
+        if not self.chunked:
+            if self.length < 0 and matcher is None:
+                return False  # the body ends when the server closes the connection, no need to read it
+            return await self._consume(reader, self.length, matcher, limit, to_end) == self.length
+
+        while True:
+            line = await self._line(reader)
+            if line is None:
+                return False
+            size = self._number(line[0], line[1], 16)
+            if size < 0:
+                return False
+            if size == 0:
+                break
+            consumed = await self._consume(reader, size, matcher, limit, to_end)
+            if consumed != size:
+                return False
+            limit -= size
+            line = await self._line(reader)  # the line ending after the chunk
+            if line is None or line[0] != line[1]:
+                return False
+
+        while True:  # trailers
+            line = await self._line(reader)
+            if line is None:
+                return False
+            if line[0] == line[1]:
+                return True
+
+    async def _consume(self, reader, count, matcher, limit, to_end):
+        """Reads count bytes, or until the end if count is -1. Returns the number read, which is less than count if
+        reading stopped early."""
+        consumed = 0
+        while count < 0 or consumed < count:
+            if self.start == self.end and not await self._fill(reader):
+                break
+            end = self.end if count < 0 else min(self.end, self.start + count - consumed)
+            end = min(end, self.start + limit - consumed)
+            if matcher is not None and matcher.feed(self.buffer, self.start, end) and not to_end:
+                consumed += end - self.start
+                self.start = end
+                break
+            consumed += end - self.start
+            self.start = end
+            if consumed >= limit:
+                break
+        return consumed
@@ -0,0 +1,124 @@
+import socket
+import time
+import ustruct
+import uos
+import uasyncio as asyncio
+
+ECHO_REPLY = 0
+ECHO_REQUEST = 8
+PACKET_SIZE = 64
+PAYLOAD = b'Q' * (PACKET_SIZE - 8)
+NAN = float("nan")
+
+
+def _sum(data):
+    total = 0
+    for pos in range(0, len(data) - 1, 2):
+        total += (data[pos] << 8) + data[pos + 1]
+    if len(data) & 0x1:  # Odd number of bytes
+        total += data[-1] << 8
+    return total
+
+
+def _fold(total):
+    while total >= 0x10000:
+        total = (total & 0xffff) + (total >> 16)
+    return ~total & 0xffff
+
+
+def checksum(data):
+    return _fold(_sum(data))
+
+
+class ICMPEngine:
+    """Sends echo requests for every ICMP service over one raw socket.
+
+    A single reader task matches echo replies to waiting pings by identifier and sequence number.
+    """
+
+    def __init__(self, sock=None):
+        if sock is None:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, 1)
+            sock.setblocking(False)
+        self.sock = sock
+        self.reader = None
+
+        self.id = ustruct.unpack("!H", uos.urandom(2))[0]
+        self.seq = 0
+        self.pending = {}  # seq: request
+        self.reply = bytearray(PACKET_SIZE + 60)  # room for the largest IP header
+
+        self.packet = bytearray(PACKET_SIZE)
+        self.packet[8:] = PAYLOAD
+        # the payload never changes, so the checksum only needs the header words added for each request
+        self.base_sum = _sum(PAYLOAD) + (ECHO_REQUEST << 8) + self.id
+
+    def create_request(self):
+        """State of a ping, [event, ticks_ms sent, latency]. Callers keep one to reuse for each of their pings."""
+        return [asyncio.Event(), 0, NAN]
+
+    async def ping(self, destination, timeout, request=None):
+        """Returns the round trip time to destination, an (address, port) tuple, in ms, or NaN if there was no reply
+        within timeout seconds. request is one from create_request that is not in use by another ping."""
+        if self.reader is None:
+            self.reader = asyncio.StreamReader(self.sock)
+            asyncio.create_task(self._receive())
+
+        self.seq = (self.seq + 1) & 0xFFFF
+        seq = self.seq
+        if request is None:
+            request = self.create_request()
+        request[0].clear()
+        request[2] = NAN
+        self.pending[seq] = request
+
+        try:
+            # only the header words that change are added to the checksum of the rest of the packet
+            ustruct.pack_into("!BBHHH", self.packet, 0, ECHO_REQUEST, 0, _fold(self.base_sum + seq), self.id, seq)
+            request[1] = time.ticks_ms()
+            self.sock.sendto(self.packet, destination)
+            await asyncio.wait_for(request[0].wait(), timeout)
+        except OSError as e:
+            print("Failed to send ping to {}: {}".format(destination[0], e))
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            del self.pending[seq]
+
+        return request[2]
+
+    async def _receive(self):
+        data = self.reply
+        while True:
+            try:
+                length = await self.reader.readinto(data)
+            except OSError as e:
+                print("ICMP engine encountered OSError " + str(e))
+                await asyncio.sleep(1)
+                continue
+            now = time.ticks_ms()
+
+            if not length:
+                continue
+            offset = (data[0] & 0x0F) * 4  # IP header length
+            if length < offset + 8:
+                continue
+
+            # read in place, as unpacking would allocate a tuple for every reply
+            reply_id = (data[offset + 4] << 8) | data[offset + 5]
+            seq = (data[offset + 6] << 8) | data[offset + 7]
+            if data[offset] == ECHO_REPLY and reply_id == self.id:
+                request = self.pending.get(seq)
+                if request is not None:
+                    request[2] = time.ticks_diff(now, request[1])
+                    request[0].set()
+
+
+engine = None
+
+
+def get_engine():
+    global engine
+    if engine is None:
+        engine = ICMPEngine()
+    return engine
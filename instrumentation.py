@@ -0,0 +1,44 @@
+import gc
+import time
+import uasyncio as asyncio
+
+SENTINEL_INTERVAL = 100  # ms
+
+loop_lag = 0  # ms the sentinel task woke up late, most recent
+max_loop_lag = 0
+lowest_mem_free = None
+
+
+def sample_heap():
+    global lowest_mem_free
+    free = gc.mem_free()
+    if lowest_mem_free is None or free < lowest_mem_free:
+        lowest_mem_free = free
+    return free
+
+
+def largest_free_block():
+    """Size of the largest bytearray that can currently be allocated, found by binary search."""
+    low = 0
+    high = gc.mem_free()
+    while low < high:
+        size = (low + high + 1) // 2
+        try:
+            block = bytearray(size)
+            del block
+            low = size
+        except MemoryError:
+            high = size - 1
+    return low
+
+
+async def run_sentinel():
+    """Measures event loop lag as how late a sleeping task wakes up, sampling the heap low-water mark as it goes."""
+    global loop_lag, max_loop_lag
+    while True:
+        expected = time.ticks_add(time.ticks_ms(), SENTINEL_INTERVAL)
+        await asyncio.sleep_ms(SENTINEL_INTERVAL)
+        loop_lag = max(time.ticks_diff(time.ticks_ms(), expected), 0)
+        if loop_lag > max_loop_lag:
+            max_loop_lag = loop_lag
+        sample_heap()
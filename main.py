@@ -1,14 +1,17 @@
-from json import load
+import bootprofile
+from configcache import load_config
 from machine import WDT, freq
-from services import *
-from notifiers import *
-from utils import *
-from math import isnan
+from services import HTTPService, ICMPService, DNSService, TCPService, UDPService
+from utils import led
+from scheduler import Scheduler
 import sys
+import history
 import network
-import asciichartpy
+import resolver
 import uasyncio as asyncio
 
+bootprofile.mark("imports")
+
 
 async def web_server_handler(reader, writer):
     print("Handling web request...")
@@ -23,37 +26,61 @@ async def web_server_handler(reader, writer):
             writer.write("HTTP/1.0 400 Bad Request\r\n\r\n")
             await writer.drain()
         else:
-            service_path = line[1].split(b'/')[1]
+            path = line[1].split(b'?', 1)
+            segments = path[0].split(b'/')
+            service_path = segments[1]
+            query = parse_query(path[1] if len(path) == 2 else b'')
+            if_none_match = None
+            accepts_gzip = False
             while True:
                 line = await reader.readline()
                 if not line or line == b'\r\n':
                     break
+                if line[:14].lower() == b"if-none-match:":
+                    if_none_match = line[14:].strip().decode()
+                elif line[:16].lower() == b"accept-encoding:":
+                    accepts_gzip = b"gzip" in line
 
             if service_path == b'':
-                table_rows = '\n'.join(["<tr><td><a href=\"{}\">{}</a></td><td>{}</td><td>{}</td></tr>".format(service.get_name(),
-                                                                                                    service.get_name(),
-                                                                                                    "Online" if service.get_status() else "Offline",
-                                                                                                    service.get_history()[-1] if not isnan(service.get_history()[-1]) else "N/A")
-                                        for service in monitored_services])
-
-                response = status_html.format(table_rows, sta_if.ifconfig()[0])
-                writer.write("HTTP/1.0 200 OK\r\nContent-type: text/html\r\n\r\n")
+                await write_page(writer, status_page(monitored_services, sta_if.ifconfig()[0], if_none_match))
+            elif service_path == b"metrics":
+                await write_page(writer, metrics_page(monitored_services))
+            elif service_path == b"boot":
+                await write_page(writer, boot_page())
+            elif service_path == b"debug":
+                await write_page(writer, debug_page(monitored_services))
+            elif service_path == b"api" and len(segments) == 3:
+                for service in monitored_services:
+                    if service.get_name().encode("UTF-8") == segments[2]:
+                        await write_page(writer, api_page(service))
+                        return
+
+                print("404")
+                writer.write("HTTP/1.0 404 Not Found\r\n\r\n")
                 await writer.drain()
-                writer.write(response)
+            elif service_path == b"api" and len(segments) == 4 and segments[3] == b"history":
+                resolution = query.get(b"resolution", b"raw").decode()
+                for service in monitored_services:
+                    if service.get_name().encode("UTF-8") == segments[2]:
+                        page = history_feed(service, resolution, if_none_match)
+                        if page is None:
+                            break
+                        await write_page(writer, page)
+                        return
+
+                print("404")
+                writer.write("HTTP/1.0 404 Not Found\r\n\r\n")
                 await writer.drain()
             else:
+                resolution = query.get(b"resolution", b"raw").decode()
                 for service in monitored_services:
                     if service.get_name().encode("UTF-8") == service_path:
-                        max_latency = max(service.get_history()) if len(service.get_history()) != 0 else 1  # no pings
-                        max_latency = max_latency if not isnan(max_latency) else 1  # protects max([nan, 5]) = nan
-                        response = service_html.format(service.get_name(),
-                                                       asciichartpy.plot(service.get_history(), height=10,
-                                                       maximum=max_latency if max_latency % 50 == 0 else max_latency + 50 - max_latency % 50),
-                                                       "{:0.0f} minutes ago".format(service.get_check_interval() * len(service.get_history()) / 60))
-                        writer.write("HTTP/1.0 200 OK\r\nContent-type: text/html\r\n\r\n")
-                        await writer.drain()
-                        writer.write(response)
-                        await writer.drain()
+                        page = bundle_page(if_none_match) if accepts_gzip else None  # the browser draws the chart
+                        if page is None:
+                            page = service_page(service, resolution, if_none_match)
+                        if page is None:
+                            break
+                        await write_page(writer, page)
                         return
 
                 print("404")
@@ -69,6 +96,15 @@ async def web_server_handler(reader, writer):
         freq(80000000)
 
 
+def parse_query(query):
+    parameters = {}
+    for pair in query.split(b'&'):
+        pair = pair.split(b'=', 1)
+        if len(pair) == 2:
+            parameters[pair[0]] = pair[1]
+    return parameters
+
+
 def wifi_ap_fallback(message):
     print("AP fallback: {}".format(message))
     import webrepl, time
@@ -95,8 +131,18 @@ def set_global_exception():
 async def main():
     set_global_exception()
 
-    for service in monitored_services:
-        asyncio.create_task(service.monitor())
+    if clock_enabled:
+        asyncio.create_task(clock.run())
+
+    for notifier in notifiers:
+        asyncio.create_task(notifier.run())
+
+    asyncio.create_task(Scheduler(monitored_services, max_concurrent_checks).run())
+
+    if history_log is not None:
+        asyncio.create_task(history_log.run())
+
+    bootprofile.mark("tasks")
 
     while True:
         if watchdog_enabled:
@@ -107,10 +153,11 @@ async def main():
 led(0)
 
 try:
-    with open("config.json", "r") as config_file:
-        config = load(config_file)
-except ValueError:
-    wifi_ap_fallback("Invalid JSON in config file!")
+    config, config_records = load_config("config.json", "config.cache")
+except ValueError as e:
+    wifi_ap_fallback("Invalid config file: " + str(e))
+except KeyError as e:
+    wifi_ap_fallback("Missing required configuration value " + e.args[0])
 except OSError:
     wifi_ap_fallback("minutePing successfully installed. See documentation for creating a config.json file.")
 
@@ -137,35 +184,75 @@ try:
             raise ValueError("WebREPL password must be between 4 and 9 characters")
 
     web_server_enabled = config["web_server"] if "web_server" in config else True
+    page_cache_size = config["page_cache_size"] if "page_cache_size" in config else 4096
 
     watchdog_enabled = config["watchdog"] if "watchdog" in config else True
 
-    notifiers = []
-    for notifier_config in config["notifiers"]:
-        if notifier_config["type"] not in ["email"]:
-            print("Notifier configuration is of invalid type {}".format(notifier_config["type"]))
-            sys.exit(1)
-        elif notifier_config["type"] == "email":
-            notifiers.append(EmailNotifier(notifier_config))
+    max_concurrent_checks = config["max_concurrent_checks"] if "max_concurrent_checks" in config else 3
 
+    ntp_host = config["ntp_host"] if "ntp_host" in config else None
+    ntp_sync_interval = config["ntp_sync_interval"] if "ntp_sync_interval" in config else None
+
+    history_log_config = config["history_log"] if "history_log" in config else True
+
+    if "uptime_windows" in config:  # read by services as they are created
+        history.uptime_windows = config["uptime_windows"]
+
+    notifiers = []
     monitored_services = []
-    for service_config in config["services"]:
-        if service_config["type"] not in ["icmp", "http", "dns"]:
-            print(
-                "Service configuration {} is of invalid type {}".format(service_config["name"], service_config["type"]))
-            sys.exit(1)
-        elif service_config["type"] == "http":
-            monitored_services.append(HTTPService(service_config, notifiers))
-        elif service_config["type"] == "icmp":
-            monitored_services.append(ICMPService(service_config, notifiers))
-        elif service_config["type"] == "dns":
-            monitored_services.append(DNSService(service_config, notifiers))
+    for kind, item_config in config_records:  # types were validated when the configuration was compiled
+        if kind == "notifier":
+            from notifiers import EmailNotifier, Outbox
+
+            if item_config["type"] == "email":
+                notifiers.append(Outbox(EmailNotifier(item_config), item_config))
+        elif item_config["type"] == "http":
+            monitored_services.append(HTTPService(item_config, notifiers))
+        elif item_config["type"] == "icmp":
+            monitored_services.append(ICMPService(item_config, notifiers))
+        elif item_config["type"] == "dns":
+            monitored_services.append(DNSService(item_config, notifiers))
+        elif item_config["type"] == "tcp":
+            monitored_services.append(TCPService(item_config, notifiers))
+        elif item_config["type"] == "udp":
+            monitored_services.append(UDPService(item_config, notifiers))
+        del item_config
+
+    history_log = None
+    if history_log_config:
+        from historylog import HistoryLog
+
+        history_log_config = history_log_config if isinstance(history_log_config, dict) else {}
+        history_log = HistoryLog([service.get_name() for service in monitored_services],
+                                 segment_size=history_log_config["segment_size"] if "segment_size" in history_log_config else 16384,
+                                 segments=history_log_config["segments"] if "segments" in history_log_config else 4,
+                                 flush_interval=history_log_config["flush_interval"] if "flush_interval" in history_log_config else 600)
 
 except KeyError as e:
     wifi_ap_fallback("Missing required configuration value " + e.args[0])
 
 del config  # safe to delete because only needed for config loading
 
+# the clock keeps notification times and history log timestamps in UTC
+clock_enabled = len(notifiers) != 0 or history_log is not None
+if clock_enabled:
+    import clock
+    import ntptime
+
+    if ntp_host is not None:
+        ntptime.host = ntp_host
+    if ntp_sync_interval is not None:
+        clock.sync_interval = ntp_sync_interval
+
+bootprofile.mark("config")
+
+if history_log is not None:
+    print("Replaying history log...")
+    print("Replayed {} history records".format(history_log.replay(monitored_services)))
+    for index, service in enumerate(monitored_services):
+        service.set_history_log(history_log, index)
+    bootprofile.mark("history replay")
+
 print("Activating Wi-Fi...")
 
 sta_if = network.WLAN(network.STA_IF)
@@ -181,6 +268,8 @@ while not sta_if.isconnected():
     pass
 
 print("Connected with network configuration " + str(sta_if.ifconfig()))
+resolver.server = sta_if.ifconfig()[3]
+bootprofile.mark("wifi")
 
 if webrepl_enabled:
     print("Starting WebREPL...")
@@ -189,31 +278,16 @@ if webrepl_enabled:
     webrepl.start(password=webrepl_password)
 
 if web_server_enabled:
+    from pages import write_page, status_page, service_page, metrics_page, api_page, boot_page, debug_page, \
+        bundle_page, history_feed, chart_cache
+
+    chart_cache.capacity = page_cache_size
     asyncio.create_task(asyncio.start_server(web_server_handler, "0.0.0.0", 80, 20))
-    status_html = """<!DOCTYPE html>
-    <html>
-        <meta name="viewport" content="width=device-width, initial-scale=1" charset="utf-8">
-        <style> * {{ font-family: monospace; }} </style>
-        <head> <title>minutePing 1.1.0</title> </head>
-        <body> <h1>Monitored services</h1> 
-            <table border="1"> <tr><th>Name</th><th>Status</th><th>Latency (ms)</th></tr> {} </table>
-            <p><a href="http://micropython.org/webrepl/#{}:8266/">Administrator interface</a><p>
-        </body>
-    </html>"""
-    service_html = """<!DOCTYPE html>
-        <html>
-            <meta name="viewport" content="width=device-width, initial-scale=1" charset="utf-8">
-            <style> * {{ font-family: monospace; }} </style>
-            <head> <title>minutePing 1.1.0</title> </head>
-            <body> <h1>{}</h1> 
-                <pre>
-  (ms)
-{}
-      {}
-                </pre>
-                <p><a href="/">Back</a><p>
-            </body>
-        </html>"""
+
+    import instrumentation  # loop lag and heap figures, only read through /debug
+
+    asyncio.create_task(instrumentation.run_sentinel())
+    bootprofile.mark("web server")
 
 led(1)
 
@@ -1,12 +1,67 @@
 from services import Service
-from utils import rtc
-import ntptime
+import clock
+import time
 import umail
 import uasyncio as asyncio
 
 
 # TODO change to superclass of notifiers
 
+class Outbox:
+    """Queues notifications for a notifier so services never wait on it.
+
+    Events arriving within coalesce_window seconds of each other are sent together. Failed sends are retried with
+    exponential backoff. An offline event still queued when the service comes back online cancels out.
+    """
+
+    def __init__(self, notifier, config):
+        self.notifier = notifier
+        self.coalesce_window = config["coalesce_window"] if "coalesce_window" in config else 10
+        self.retry_interval = config["retry_interval"] if "retry_interval" in config else 30
+        self.max_retry_interval = config["max_retry_interval"] if "max_retry_interval" in config else 1800
+
+        self.pending = []  # events: (service, status, seconds down when queued, ticks_ms when queued)
+        self.wake = asyncio.Event()
+
+    def enqueue(self, service, status):
+        self._add((service, status, service.get_check_interval() * service.get_number_of_failures(), time.ticks_ms()))
+        self.wake.set()
+
+    def _add(self, event):
+        for queued in self.pending:
+            if queued[0] is event[0]:
+                self.pending.remove(queued)
+                if queued[1] != event[1]:  # state changed back before anyone was told
+                    return
+                break
+        self.pending.append(event)
+
+    async def run(self):
+        backoff = self.retry_interval
+        while True:
+            await self.wake.wait()
+            await asyncio.sleep(self.coalesce_window)
+            self.wake.clear()
+
+            events = self.pending
+            self.pending = []
+            if len(events) == 0:
+                continue
+
+            if await self.notifier.notify(events):
+                backoff = self.retry_interval
+            else:
+                newer = self.pending
+                self.pending = events
+                for event in newer:
+                    self._add(event)
+
+                print("Retrying notification in {} seconds".format(backoff))
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_retry_interval)
+                self.wake.set()
+
+
 class EmailNotifier:
     def __init__(self, config):
         self.recipient_email_addresses = config["recipient_addresses"]
@@ -14,40 +69,49 @@ class EmailNotifier:
         self.smtp_port = config["port"]
         self.smtp_username = config["username"]
         self.smtp_password = config["password"]
+        self.smtp = umail.SMTP(config["smtp_idle_timeout"] if "smtp_idle_timeout" in config else 60)
 
         send_test = config["test"] if "test" in config else False
         if send_test:
-            asyncio.create_task(self.notify(Service({"name": "TEST EMAIL SERVICE", "host": "email.test"}), "BEING TESTED"))
+            asyncio.create_task(self.notify([(Service({"name": "TEST EMAIL SERVICE", "host": "email.test"}),
+                                              "BEING TESTED", 0, time.ticks_ms())]))
         del config
 
-    async def notify(self, service_object, status):
-        await ntptime.settime()
+    async def notify(self, events):
+        current_time = clock.datetime()
 
-        minutes_since_failure = service_object.get_check_interval() * service_object.get_number_of_failures() / 60
-        minutes_since_failure = int(minutes_since_failure) if int(minutes_since_failure) == minutes_since_failure \
-            else round(minutes_since_failure, 1)
+        if len(events) == 1:
+            subject = "Monitored service {} is {}".format(events[0][0].get_name(), events[0][1])
+        else:
+            subject = "{} monitored services changed state".format(len(events))
 
-        current_time = rtc.datetime()
+        lines = []
+        for service, status, seconds_down, queued in events:
+            minutes_since_failure = (seconds_down + time.ticks_diff(time.ticks_ms(), queued) / 1000) / 60
+            minutes_since_failure = int(minutes_since_failure) if int(minutes_since_failure) == minutes_since_failure \
+                else round(minutes_since_failure, 1)
+            lines.append("Monitored service {} was detected as {} {:0.0f} minutes ago.\n".format(
+                service.get_name(), status, minutes_since_failure))
 
         print("Sending email notification...")
 
         try:
-            smtp = umail.SMTP()
             # to = RECIPIENT_EMAIL_ADDRESSES if type(RECIPIENT_EMAIL_ADDRESSES) == str else ", ".join(RECIPIENT_EMAIL_ADDRESSES)
-            await smtp.login(self.smtp_server, self.smtp_port, self.smtp_username, self.smtp_password)
-            await smtp.to(self.recipient_email_addresses)
-            await smtp.send("From: minutePing <{}>\n"
-                            "Subject: Monitored service {} is {}\n\n"
+            await self.smtp.connect(self.smtp_server, self.smtp_port, self.smtp_username, self.smtp_password)
+            await self.smtp.to(self.recipient_email_addresses)
+            await self.smtp.send("From: minutePing <{}>\n"
+                            "Subject: {}\n\n"
                             "Current time: {:02d}:{:02d}:{:02d} {:02d}/{:02d}/{} UTC\n\n"
-                            "Monitored service {} was detected as {} {:0.0f} minutes ago.\n".format(self.smtp_username,
-                                        service_object.get_name(), status,
-                                        current_time[4], current_time[5], current_time[6],
+                            "{}".format(self.smtp_username, subject,
+                                        current_time[3], current_time[4], current_time[5],
                                         current_time[2], current_time[1], current_time[0],
-                                        service_object.get_name(), status, minutes_since_failure))
-            await smtp.quit()
+                                        "".join(lines)))
 
             print("Email successfully sent")
             return True
         except (AssertionError, OSError, asyncio.TimeoutError) as e:
-            print("Failed to send email notification: " + str(e.args[0]))
+            print("Failed to send email notification: " + repr(e))  # timeouts have no args
+            await self.smtp.close()  # the session may be unusable, log in again next time
             return False
+        finally:
+            self.smtp.release()
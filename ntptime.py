@@ -3,20 +3,23 @@ import ustruct
 import uasyncio as asyncio
 import machine
 import utime
+import resolver
 
 # (date(2000, 1, 1) - date(1900, 1, 1)).days * 24*60*60
 NTP_DELTA = 3155673600
 
 # The NTP host can be configured at runtime by doing: ntptime.host = 'myhost.org'
 host = "pool.ntp.org"
+port = 123
 
 
-async def time():
+async def query():
+    """Returns (ms since 2000-01-01 UTC when the reply arrived, round trip time in ms)."""
     NTP_QUERY = bytearray(48)
     NTP_QUERY[0] = 0x1B
 
+    addr = (await resolver.resolve(host), port)
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    addr = socket.getaddrinfo(host, 123)[0][-1]
     sock.setblocking(False)
 
     try:
@@ -31,7 +34,9 @@ async def time():
     try:
         writer.write(NTP_QUERY)
         await writer.drain()
+        sent = utime.ticks_ms()
         msg = await reader.read(48)
+        round_trip = utime.ticks_diff(utime.ticks_ms(), sent)
     finally:
         writer.close()
         await writer.wait_closed()
@@ -39,8 +44,12 @@ async def time():
         await reader.wait_closed()
         sock.close()
 
-    val = ustruct.unpack("!I", msg[40:44])[0]
-    return val - NTP_DELTA
+    val, fraction = ustruct.unpack("!II", msg[40:48])
+    return (val - NTP_DELTA) * 1000 + (fraction * 1000 >> 32) + round_trip // 2, round_trip
+
+
+async def time():
+    return (await query())[0] // 1000
 
 
 # There's currently no timezone support in MicroPython, and the RTC is set in UTC time.
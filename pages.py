@@ -0,0 +1,474 @@
+from history import ROLLUP_RESOLUTIONS, MISSING
+from math import isnan
+import resolver
+import bootprofile
+import instrumentation
+import sys
+import time
+import ubinascii
+import uos
+
+CHUNK_SIZE = 512  # bytes written to the socket between drains
+NAN = float("nan")
+
+OK_HEADER = "HTTP/1.0 200 OK\r\nContent-type: text/html\r\nCache-Control: no-cache\r\nETag: {}\r\n\r\n"
+NOT_MODIFIED_HEADER = "HTTP/1.0 304 Not Modified\r\nETag: {}\r\n\r\n"
+# /<name> serves the bundle or the service page depending on Accept-Encoding, so caches must keep both
+SERVICE_HEADER = "HTTP/1.0 200 OK\r\nContent-type: text/html\r\nCache-Control: no-cache\r\nVary: Accept-Encoding\r\n" \
+                 "ETag: {}\r\n\r\n"
+SERVICE_NOT_MODIFIED_HEADER = "HTTP/1.0 304 Not Modified\r\nVary: Accept-Encoding\r\nETag: {}\r\n\r\n"
+
+# client-side service page, web/service.html compressed with gzip and uploaded to the board
+BUNDLE_PATH = "service.html.gz"
+BUNDLE_HEADER = "HTTP/1.0 200 OK\r\nContent-type: text/html\r\nContent-Encoding: gzip\r\n" \
+                "Cache-Control: max-age=604800\r\nVary: Accept-Encoding\r\nETag: {}\r\n\r\n"
+HISTORY_HEADER = "HTTP/1.0 200 OK\r\nContent-type: application/octet-stream\r\nCache-Control: no-cache\r\n" \
+                 "ETag: {}\r\nX-Period: {}\r\n\r\n"
+HISTORY_CHUNK = 128  # samples encoded per write
+
+# distinguishes ETags across reboots, when service versions start again from zero
+BOOT_ID = ubinascii.hexlify(uos.urandom(4)).decode()
+
+STATUS_HEAD = """<!DOCTYPE html>
+    <html>
+        <meta name="viewport" content="width=device-width, initial-scale=1" charset="utf-8">
+        <style> * {{ font-family: monospace; }} </style>
+        <head> <title>minutePing 1.1.0</title> </head>
+        <body> <h1>Monitored services</h1>
+            <table border="1"> <tr><th>Name</th><th>Status</th><th>Latency (ms)</th><th>Uptime % ({})</th>
+                <th>p50 / p95 / p99 (ms)</th><th>Jitter (ms)</th></tr> """
+STATUS_ROW = "<tr><td><a href=\"{}\">{}</a></td><td>{}</td><td>{}</td><td>{}</td><td>{}</td><td>{}</td></tr>\n"
+PERCENTILES = (50, 95, 99)
+STATUS_TAIL = """ </table>
+            <p>{}</p>
+            <p><a href="http://micropython.org/webrepl/#{}:8266/">Administrator interface</a><p>
+        </body>
+    </html>"""
+
+SERVICE_HEAD = """<!DOCTYPE html>
+        <html>
+            <meta name="viewport" content="width=device-width, initial-scale=1" charset="utf-8">
+            <style> * {{ font-family: monospace; }} </style>
+            <head> <title>minutePing 1.1.0</title> </head>
+            <body> <h1>{}</h1>
+                <p>Resolution: {}</p>
+                <pre>
+  (ms)
+"""
+SERVICE_TAIL = """      {}
+                </pre>
+                <p>{}</p>{}
+                <p><a href="/">Back</a><p>
+            </body>
+        </html>"""
+
+RESOLUTION_LINKS = " | ".join(["<a href=\"?resolution={0}\">{0}</a>".format(resolution)
+                               for resolution in ["raw"] + [rollup[0] for rollup in ROLLUP_RESOLUTIONS]])
+
+
+class ChartCache:
+    """Least recently used cache of chart grids, bounded by the total size in bytes of the grids held.
+
+    A cached grid only has to draw the samples added since it was last shown.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.size = 0
+        self.charts = {}  # key: grid
+        self.order = []  # keys, least recently used first
+
+    def get(self, key):
+        grid = self.charts.get(key)
+        if grid is None:
+            return None
+        self.order.remove(key)
+        self.order.append(key)
+        return grid
+
+    def put(self, key, grid):
+        if key in self.charts:
+            self.size -= len(self.charts.pop(key))
+            self.order.remove(key)
+        if len(grid) > self.capacity:
+            return
+        while self.size + len(grid) > self.capacity:
+            self.size -= len(self.charts.pop(self.order.pop(0)))
+        self.charts[key] = grid
+        self.order.append(key)
+        self.size += len(grid)
+
+
+chart_cache = ChartCache(4096)
+
+
+async def write_page(writer, fragments):
+    """Writes fragments to the writer, draining every CHUNK_SIZE bytes so the send buffer stays bounded."""
+    pending = 0
+    for fragment in fragments:
+        writer.write(fragment)
+        pending += len(fragment)
+        if pending >= CHUNK_SIZE:
+            await writer.drain()
+            pending = 0
+    await writer.drain()
+
+
+def format_time_ago(seconds):
+    if seconds < 7200:
+        return "{:0.0f} minutes ago".format(seconds / 60)
+    elif seconds < 172800:
+        return "{:0.0f} hours ago".format(seconds / 3600)
+    else:
+        return "{:0.0f} days ago".format(seconds / 86400)
+
+
+def format_period(seconds):
+    if seconds % 86400 == 0 and seconds >= 172800:
+        return "{}d".format(seconds // 86400)
+    elif seconds % 3600 == 0:
+        return "{}h".format(seconds // 3600)
+    elif seconds % 60 == 0:
+        return "{}m".format(seconds // 60)
+    return "{}s".format(seconds)
+
+
+def _clock():
+    return sys.modules.get("clock")  # only loaded when notifiers or the history log need it
+
+
+def clock_status():
+    clock = _clock()
+    if clock is None:
+        return "Clock not in use"
+    if clock.get_sync_age() is None:
+        return "Clock not yet synchronised with NTP"
+    synced = time.gmtime(clock.now() - clock.get_sync_age())
+    return "Clock last synchronised at {:02d}:{:02d}:{:02d} UTC, NTP round trip {} ms".format(
+        synced[3], synced[4], synced[5], clock.get_round_trip())
+
+
+def status_page(services, address, if_none_match=None):
+    version = 0
+    for service in services:
+        version += service.get_version()
+    etag = "\"{}-{}-{}\"".format(BOOT_ID, version, _clock().get_syncs() if _clock() is not None else 0)
+    if if_none_match == etag:
+        yield NOT_MODIFIED_HEADER.format(etag)
+        return
+
+    yield OK_HEADER.format(etag)
+    yield STATUS_HEAD.format(" / ".join([format_period(window.get_period())
+                                         for window in services[0].get_statistics().get_windows()])
+                             if len(services) != 0 else "")
+    for service in services:
+        latency = service.get_history()[-1] if len(service.get_history()) != 0 else NAN
+        statistics = service.get_statistics()
+        yield STATUS_ROW.format(service.get_name(), service.get_name(),
+                                "Online" if service.get_status() else "Offline",
+                                "{:0.0f}".format(latency) if not isnan(latency) else "N/A",
+                                " / ".join(["{:0.1f}".format(window.ratio() * 100) if not isnan(window.ratio()) else "N/A"
+                                            for window in statistics.get_windows()]),
+                                " / ".join([_format_latency(statistics.percentile(percent), "N/A")
+                                            for percent in PERCENTILES]),
+                                _format_latency(statistics.get_jitter(), "N/A"))
+    yield STATUS_TAIL.format(clock_status(), address)
+
+
+def _series(service, resolution):
+    """Returns the service's samples at the resolution and the seconds between them, or (None, None)."""
+    if resolution == "raw":
+        return service.get_history(), service.get_check_interval()
+    series = service.get_rollup(resolution)
+    if series is None:
+        return None, None
+    return series, series.get_period()
+
+
+def service_page(service, resolution, if_none_match=None):
+    """Returns a generator of the service's page, or None if the resolution does not exist."""
+    series, period = _series(service, resolution)
+    if series is None:
+        return None
+    summary = ''
+    if resolution != "raw":
+        count, failures, minimum, mean, maximum = series.summary()
+        summary = "{} checks, {} failed. Min {}, mean {}, max {} ms".format(
+            count, failures, *["{:0.0f}".format(value) if not isnan(value) else "N/A"
+                               for value in (minimum, mean, maximum)])
+
+    return _service_page(service, resolution, series, period, summary, if_none_match)
+
+
+def _service_page(service, resolution, series, period, summary, if_none_match):
+    version = service.get_version()
+    span = format_time_ago(period * len(series))  # of the samples charted, which may change while the page is sent
+    etag = "\"{}-{}-{}\"".format(BOOT_ID, version, resolution)
+    if if_none_match == etag:
+        yield SERVICE_NOT_MODIFIED_HEADER.format(etag)
+        return
+
+    yield SERVICE_HEADER.format(etag)
+    yield SERVICE_HEAD.format(service.get_name(), RESOLUTION_LINKS)
+
+    key = (service.get_name(), resolution)
+    grid = chart_cache.get(key)
+    if grid is None or grid.get_version() != version and grid.is_streaming():
+        from chart import ChartGrid
+
+        # a grid another request is still writing out is left to it, and replaced in the cache by a new one
+        grid = ChartGrid(series.length)
+        chart_cache.put(key, grid)
+
+    if grid.get_version() != version:
+        max_latency = max(series) if len(series) != 0 else 1  # no pings
+        max_latency = max_latency if not isnan(max_latency) else 1  # protects max([nan, 5]) = nan
+        grid.update(series, max_latency if max_latency % 50 == 0 else max_latency + 50 - max_latency % 50, version)
+
+    for row in grid.rows_out():
+        yield row
+        yield "\n"  # after the row, as rows_out writes the next row into the same buffer
+
+    yield SERVICE_TAIL.format(span, summary, phase_summary(service))
+
+
+def bundle_page(if_none_match=None):
+    """Returns a generator of the precompressed client-side service page, or None if it is not on flash."""
+    try:
+        stat = uos.stat(BUNDLE_PATH)
+    except OSError:
+        return None
+    return _bundle_page("\"{}-{}\"".format(stat[6], stat[8]), if_none_match)  # size and modification time
+
+
+def _bundle_page(etag, if_none_match):
+    if if_none_match == etag:
+        yield SERVICE_NOT_MODIFIED_HEADER.format(etag)
+        return
+
+    yield BUNDLE_HEADER.format(etag)
+    buffer = bytearray(CHUNK_SIZE)
+    with open(BUNDLE_PATH, "rb") as bundle:
+        while True:
+            length = bundle.readinto(buffer)
+            if not length:
+                break
+            yield memoryview(buffer)[:length]
+
+
+def history_feed(service, resolution, if_none_match=None):
+    """Returns a generator of the service's latency history for the client-side page, or None if the resolution does
+    not exist.
+
+    Samples are oldest first, as little endian 16 bit milliseconds with MISSING for failed checks. The X-Period header
+    holds the seconds between samples.
+    """
+    series, period = _series(service, resolution)
+    if series is None:
+        return None
+    return _history_feed(service, resolution, series, period, if_none_match)
+
+
+def _history_feed(service, resolution, series, period, if_none_match):
+    etag = "\"{}-{}-{}\"".format(BOOT_ID, service.get_version(), resolution)
+    if if_none_match == etag:
+        yield NOT_MODIFIED_HEADER.format(etag)
+        return
+
+    yield HISTORY_HEADER.format(etag, period)
+    buffer = bytearray(2 * HISTORY_CHUNK)
+    end = 0
+    for latency in series:
+        value = MISSING if isnan(latency) else min(int(latency + 0.5), MISSING - 1)
+        buffer[end] = value & 0xFF
+        buffer[end + 1] = value >> 8
+        end += 2
+        if end == len(buffer):
+            yield buffer
+            end = 0
+    if end:
+        yield memoryview(buffer)[:end]
+
+
+def phase_summary(service):
+    """Latest and mean duration of each phase of the service's checks, as a table, or '' if it has no phases."""
+    phases = service.get_phases()
+    if phases is None or len(phases) == 0:
+        return ''
+    names = phases.get_phases()
+    return "\n                <table border=\"1\"><tr><th>Phase (ms)</th><th>Latest</th><th>Mean</th></tr>{}</table>".format(
+        ''.join(["<tr><td>{}</td><td>{}</td><td>{}</td></tr>".format(
+            names[phase], _format_latency(phases.get(-1, phase), "N/A"), _format_latency(phases.mean(phase), "N/A"))
+            for phase in range(len(names))]))
+
+
+TEXT_HEADER = "HTTP/1.0 200 OK\r\nContent-type: text/plain\r\n\r\n"
+METRICS_HEADER = "HTTP/1.0 200 OK\r\nContent-type: text/plain; version=0.0.4\r\n\r\n"
+API_HEADER = "HTTP/1.0 200 OK\r\nContent-type: application/json\r\n\r\n"
+
+# name, type, help, function returning the value for a service
+METRICS = (
+    ("minuteping_up", "gauge", "Whether the service is online (1) or offline (0).",
+     lambda service: 1 if service.get_status() else 0),
+    ("minuteping_latency_milliseconds", "gauge", "Latency of the most recent check, NaN if it failed.",
+     lambda service: _format_latency(service.get_history()[-1] if len(service.get_history()) != 0 else NAN, "NaN")),
+    ("minuteping_latency_ewma_milliseconds", "gauge", "Exponentially weighted moving average of latency, NaN before the first success.",
+     lambda service: _format_latency(service.get_statistics().get_ewma(), "NaN")),
+    ("minuteping_jitter_milliseconds", "gauge", "Smoothed difference between the latencies of consecutive successful checks.",
+     lambda service: _format_latency(service.get_statistics().get_jitter(), "NaN")),
+    ("minuteping_consecutive_failures", "gauge", "Number of consecutive failed checks.",
+     lambda service: service.get_number_of_failures()),
+    ("minuteping_schedule_lag_milliseconds", "gauge", "How late the most recent check started after it was due.",
+     lambda service: service.get_schedule_lag()),
+    ("minuteping_checks_total", "counter", "Number of check results recorded since boot, including any replayed from the history log.",
+     lambda service: service.get_version()),
+)
+
+
+def _format_latency(latency, nan):
+    return "{:0.0f}".format(latency) if not isnan(latency) else nan
+
+
+# backslashes first, so those added by the other replacements are not escaped again
+LABEL_ESCAPES = (("\\", "\\\\"), ("\"", "\\\""), ("\n", "\\n"))  # Prometheus label values
+JSON_ESCAPES = LABEL_ESCAPES + (("\r", "\\r"), ("\t", "\\t"))
+
+
+def _escape(text, escapes):
+    """Returns text unchanged, without copying it, if there is nothing to escape."""
+    for character, escaped in escapes:
+        if character in text:
+            text = text.replace(character, escaped)
+    return text
+
+
+def metrics_page(services):
+    """Prometheus text exposition of every service, including its latency history by number of samples ago."""
+    yield METRICS_HEADER
+    for name, metric_type, description, value in METRICS:
+        yield "# HELP {} {}\n# TYPE {} {}\n".format(name, description, name, metric_type)
+        for service in services:
+            yield "{}{{service=\"{}\"}} {}\n".format(name, _escape(service.get_name(), LABEL_ESCAPES), value(service))
+
+    hits, misses = resolver.get_stats()
+    yield "# HELP minuteping_dns_cache_hits_total Host lookups answered from the resolver cache.\n" \
+          "# TYPE minuteping_dns_cache_hits_total counter\nminuteping_dns_cache_hits_total {}\n".format(hits)
+    yield "# HELP minuteping_dns_cache_misses_total Host lookups sent to the DNS server.\n" \
+          "# TYPE minuteping_dns_cache_misses_total counter\nminuteping_dns_cache_misses_total {}\n".format(misses)
+
+    clock = _clock()
+    if clock is not None and clock.get_sync_age() is not None:
+        yield "# HELP minuteping_clock_sync_age_seconds Time since the clock was last synchronised with NTP.\n" \
+              "# TYPE minuteping_clock_sync_age_seconds gauge\nminuteping_clock_sync_age_seconds {}\n".format(clock.get_sync_age())
+        yield "# HELP minuteping_clock_sync_round_trip_milliseconds Round trip time of the last NTP sync.\n" \
+              "# TYPE minuteping_clock_sync_round_trip_milliseconds gauge\n" \
+              "minuteping_clock_sync_round_trip_milliseconds {}\n".format(clock.get_round_trip())
+
+    name = "minuteping_uptime_ratio"
+    yield "# HELP {} Fraction of successful checks over the window, in seconds.\n# TYPE {} gauge\n".format(name, name)
+    for service in services:
+        label = _escape(service.get_name(), LABEL_ESCAPES)
+        for window in service.get_statistics().get_windows():
+            ratio = window.ratio()
+            yield "{}{{service=\"{}\",window=\"{}\"}} {}\n".format(name, label, window.get_period(),
+                                                                   "{:0.4f}".format(ratio) if not isnan(ratio) else "NaN")
+
+    name = "minuteping_latency_percentile_milliseconds"
+    yield "# HELP {} Approximate latency percentiles of recent successful checks.\n# TYPE {} gauge\n".format(name, name)
+    for service in services:
+        label = _escape(service.get_name(), LABEL_ESCAPES)
+        for percent in PERCENTILES:
+            yield "{}{{service=\"{}\",quantile=\"{}\"}} {}\n".format(
+                name, label, percent / 100, _format_latency(service.get_statistics().percentile(percent), "NaN"))
+
+    name = "minuteping_phase_milliseconds"
+    yield "# HELP {} Duration of each phase of the most recent check, NaN if it was not reached.\n# TYPE {} gauge\n".format(name, name)
+    for service in services:
+        phases = service.get_phases()
+        if phases is not None and len(phases) != 0:
+            label = _escape(service.get_name(), LABEL_ESCAPES)
+            for phase, phase_name in enumerate(phases.get_phases()):
+                yield "{}{{service=\"{}\",phase=\"{}\"}} {}\n".format(name, label, phase_name,
+                                                                   _format_latency(phases.get(-1, phase), "NaN"))
+
+    name = "minuteping_connection_reuse_ratio"
+    yield "# HELP {} Fraction of keep-alive checks sent over the connection left open by an earlier check.\n# TYPE {} gauge\n".format(name, name)
+    for service in services:
+        stats = service.get_connection_stats()
+        if stats is not None and stats[0] != 0:
+            yield "{}{{service=\"{}\"}} {:0.4f}\n".format(name, _escape(service.get_name(), LABEL_ESCAPES),
+                                                         stats[1] / stats[0])
+
+    name = "minuteping_history_latency_milliseconds"
+    yield "# HELP {} Latency of past checks, NaN if they failed.\n# TYPE {} gauge\n".format(name, name)
+    for service in services:
+        label = _escape(service.get_name(), LABEL_ESCAPES)
+        age = len(service.get_history())
+        for latency in service.get_history():
+            age -= 1
+            yield "{}{{service=\"{}\",age=\"{}\"}} {}\n".format(name, label, age, _format_latency(latency, "NaN"))
+
+
+def api_page(service):
+    """Compact JSON description of a service. history is oldest first, failed checks are null.
+
+    uptime is keyed by window length in seconds and percentiles by percent.
+
+    Services with a latency breakdown also have phases, holding the history of each phase since boot.
+    """
+    yield API_HEADER
+    history = service.get_history()
+    yield "{{\"name\":\"{}\",\"status\":{},\"failures\":{},\"check_interval\":{},\"latency\":{},\"history\":[".format(
+        _escape(service.get_name(), JSON_ESCAPES), "true" if service.get_status() else "false",
+        service.get_number_of_failures(), service.get_check_interval(),
+        _format_latency(history[-1] if len(history) != 0 else NAN, "null"))
+    first = True
+    for latency in history:
+        yield _format_latency(latency, "null") if first else "," + _format_latency(latency, "null")
+        first = False
+    yield "]"
+
+    statistics = service.get_statistics()
+    yield ",\"ewma\":{},\"jitter\":{},\"uptime\":{{{}}},\"percentiles\":{{{}}}".format(
+        _format_latency(statistics.get_ewma(), "null"), _format_latency(statistics.get_jitter(), "null"),
+        ",".join(["\"{}\":{}".format(window.get_period(),
+                                      "{:0.4f}".format(window.ratio()) if not isnan(window.ratio()) else "null")
+                  for window in statistics.get_windows()]),
+        ",".join(["\"{}\":{}".format(percent, _format_latency(statistics.percentile(percent), "null"))
+                  for percent in PERCENTILES]))
+
+    phases = service.get_phases()
+    if phases is not None:
+        yield ",\"phases\":{"
+        for phase, phase_name in enumerate(phases.get_phases()):
+            yield "{}\"{}\":[".format("," if phase else "", phase_name)
+            for index in range(len(phases)):
+                value = _format_latency(phases.get(index, phase), "null")
+                yield value if index == 0 else "," + value
+            yield "]"
+        yield "}"
+    yield "}"
+
+
+def boot_page():
+    """Time and free heap at the end of each startup phase."""
+    yield TEXT_HEADER
+    yield "phase ms_since_reset ms_taken free_bytes\n"
+    for line in bootprofile.report():
+        yield line
+
+
+def debug_page(services):
+    """Heap, event loop and per-service check statistics."""
+    yield TEXT_HEADER
+    yield "mem_free {}\nmem_free_low_water {}\nlargest_free_block {}\n".format(
+        instrumentation.sample_heap(), instrumentation.lowest_mem_free, instrumentation.largest_free_block())
+    yield "loop_lag_ms {}\nmax_loop_lag_ms {}\n".format(instrumentation.loop_lag, instrumentation.max_loop_lag)
+    yield "service checks last_duration_ms max_duration_ms mean_allocated_bytes schedule_lag_ms\n"
+    for service in services:
+        yield "{} {} {} {} {} {}\n".format(service.get_name(), *service.get_check_stats(), service.get_schedule_lag())
+    yield "service keep_alive_checks reused_connections\n"
+    for service in services:
+        stats = service.get_connection_stats()
+        if stats is not None:
+            yield "{} {} {}\n".format(service.get_name(), *stats)
@@ -0,0 +1,147 @@
+import socket
+import time
+import ustruct
+import uos
+import uasyncio as asyncio
+
+# The DNS server is set from the network configuration at boot, or at runtime by doing: resolver.server = '9.9.9.9'
+server = "9.9.9.9"
+port = 53
+timeout = 2  # seconds per attempt
+attempts = 2
+cache_size = 16
+MAX_TTL = 3600  # seconds, keeps expiry times well within the ticks_ms range
+
+cache = {}  # host: (address, expiry ticks_ms)
+cache_order = []  # hosts, oldest first
+hits = 0
+misses = 0
+
+
+def is_address(host):
+    parts = host.split('.')
+    if len(parts) != 4:
+        return False
+    for part in parts:
+        if not part.isdigit():
+            return False
+    return True
+
+
+def _query(host, query_id):
+    query = bytearray(ustruct.pack("!HHHHHH", query_id, 0x0100, 1, 0, 0, 0))  # recursion desired, one question
+    for label in host.split('.'):
+        query.append(len(label))
+        query.extend(label.encode())
+    query.extend(b"\x00\x00\x01\x00\x01")  # root, type A, class IN
+    return query
+
+
+def _skip_name(response, offset):
+    while True:
+        length = response[offset]
+        if length == 0:
+            return offset + 1
+        if length & 0xC0 == 0xC0:  # compression pointer ends the name
+            return offset + 2
+        offset += length + 1
+
+
+def _parse(response, query_id):
+    """Returns (address, ttl) from the first A record of the response, or None."""
+    response_id, flags, questions, answers = ustruct.unpack_from("!HHHH", response, 0)
+    if response_id != query_id or flags & 0x000F != 0:
+        return None
+
+    offset = 12
+    for _ in range(questions):
+        offset = _skip_name(response, offset) + 4
+
+    for _ in range(answers):
+        offset = _skip_name(response, offset)
+        record_type, record_class, ttl, length = ustruct.unpack_from("!HHIH", response, offset)
+        offset += 10
+        if record_type == 1 and record_class == 1 and length == 4:
+            return "{}.{}.{}.{}".format(*response[offset:offset + 4]), ttl
+        offset += length
+
+    return None
+
+
+async def _lookup(host):
+    query_id = ustruct.unpack("!H", uos.urandom(2))[0]
+    query = _query(host, query_id)
+
+    for attempt in range(attempts):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setblocking(False)
+
+        try:
+            sock.connect((server, port))
+        except OSError as e:
+            if e.errno != 115:
+                raise
+
+        reader = asyncio.StreamReader(sock)
+        writer = asyncio.StreamWriter(sock, {})
+
+        try:
+            writer.write(query)
+            await asyncio.wait_for(writer.drain(), timeout)
+            response = await asyncio.wait_for(reader.read(512), timeout)
+        except OSError as e:
+            if e.errno == 110:
+                continue
+            else:
+                raise
+        except asyncio.TimeoutError:
+            continue
+        finally:
+            sock.close()
+            reader.close()
+            await reader.wait_closed()
+            writer.close()
+            await writer.wait_closed()
+
+        try:
+            return _parse(response, query_id)
+        except (IndexError, ValueError):  # truncated or malformed response
+            return None
+
+    raise OSError(110)
+
+
+async def resolve(host):
+    """Returns the IPv4 address of host as a string. Raises OSError if it cannot be resolved."""
+    global hits, misses
+
+    if is_address(host):
+        return host
+
+    entry = cache.get(host)
+    if entry is not None:
+        if time.ticks_diff(entry[1], time.ticks_ms()) > 0:
+            hits += 1
+            return entry[0]
+        del cache[host]
+        cache_order.remove(host)
+
+    misses += 1
+    result = await _lookup(host)
+    if result is None:
+        raise OSError(-2)  # same error as getaddrinfo for unknown names
+
+    address, ttl = result
+    if ttl > 0:
+        if host in cache:  # resolved concurrently by another task
+            cache_order.remove(host)
+        while len(cache_order) >= cache_size:
+            del cache[cache_order.pop(0)]
+        cache[host] = (address, time.ticks_add(time.ticks_ms(), min(ttl, MAX_TTL) * 1000))
+        cache_order.append(host)
+
+    return address
+
+
+def get_stats():
+    return hits, misses
@@ -0,0 +1,77 @@
+from utils import led
+import time
+import uheapq
+import uasyncio as asyncio
+
+
+class Scheduler:
+    """Runs every service's checks from a heap of due times.
+
+    Checks are due a fixed check_interval after the previous check was due, so the cadence does not drift with
+    check duration. Services start spread across their interval and at most max_concurrent_checks run at once.
+    A service never runs two checks at once, as services keep per-check state; a check that comes due while the
+    previous one is still running is skipped, and the time it waited recorded as schedule lag.
+    """
+
+    def __init__(self, services, max_concurrent_checks=3):
+        self.services = services
+        self.max_concurrent_checks = max_concurrent_checks
+        self.in_flight = 0
+        self.running = bytearray(len(services))  # 1 while the service at that index is being checked
+        self.wake = asyncio.Event()
+
+        # ms since the scheduler started, kept as an unbounded integer so heap ordering survives ticks_ms wrapping
+        self.now = 0
+        self.last_ticks = time.ticks_ms()
+
+        self.queue = []  # (due, service index)
+        for index, service in enumerate(services):
+            uheapq.heappush(self.queue, (index * service.get_check_interval() * 1000 // len(services), index))
+
+    def update_clock(self):
+        ticks = time.ticks_ms()
+        self.now += time.ticks_diff(ticks, self.last_ticks)
+        self.last_ticks = ticks
+        return self.now
+
+    async def run(self):
+        while True:
+            now = self.update_clock()
+
+            while len(self.queue) != 0 and self.queue[0][0] <= now and self.in_flight < self.max_concurrent_checks:
+                due, index = uheapq.heappop(self.queue)
+                service = self.services[index]
+                service.set_schedule_lag(now - due)
+
+                interval = service.get_check_interval() * 1000
+                next_due = due + interval
+                if next_due <= now:  # fell more than an interval behind, skip the missed checks
+                    next_due += (now - next_due) // interval * interval + interval
+                uheapq.heappush(self.queue, (next_due, index))
+
+                if self.running[index]:  # still running the previous check
+                    continue
+                self.running[index] = 1
+                self.in_flight += 1
+                if self.in_flight == 1:
+                    led(0)
+                asyncio.create_task(self._check(service, index))
+
+            self.wake.clear()
+            try:
+                if self.in_flight < self.max_concurrent_checks and len(self.queue) != 0:
+                    await asyncio.wait_for_ms(self.wake.wait(), self.queue[0][0] - now)
+                else:  # woken when a check finishes
+                    await self.wake.wait()
+            except asyncio.TimeoutError:
+                pass
+
+    async def _check(self, service, index):
+        try:
+            await service.check()
+        finally:
+            self.running[index] = 0
+            self.in_flight -= 1
+            if self.in_flight == 0:
+                led(1)
+            self.wake.set()
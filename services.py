@@ -1,12 +1,18 @@
-from utils import led
+from httpresponse import ResponseReader, KeywordMatcher
+from history import History, Rollup, PhaseHistory, Statistics, ROLLUP_RESOLUTIONS, MISSING
+from array import array
 from math import isnan
+import gc
 import uasyncio as asyncio
 import socket
 import time
-import uctypes
-import ustruct
-import uos
 import uselect
+import resolver
+
+NAN = float("nan")
+DNS_QUERY = (b"\xAA\xAA\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00"
+             b"\x0a\x6d\x69\x6e\x75\x74\x65\x70\x69\x6e\x67\x04\x74\x65\x73\x74"  # minuteping.test
+             b"\x00\x00\x01\x00\x01")
 
 
 class Service:
@@ -19,52 +25,100 @@ class Service:
         self.timeout = (config["timeout"] if "timeout" in config else 1)
 
         self.notifiers = notifiers
-        self.notified = [False] * len(self.notifiers)
+        self.notified = False  # offline notification queued
         self.notify_after_failures = (config["notify_after_failures"] if "notify_after_failures" in config else 3)
         self.failures = 0
         self.status = False
 
-        self.history = []
-        self.max_history_length = 50   # could be user programmable
+        self.max_history_length = (config["max_history_length"] if "max_history_length" in config else 50)
+        self.history = History(self.max_history_length)
+        self.rollups = {}
+        for resolution, period, length in ROLLUP_RESOLUTIONS:
+            self.rollups[resolution] = Rollup(period, length)
+        self.statistics = Statistics()
+        self.history_log = None
+        self.address = None  # (address, port) of the latest check, rebuilt only when the host's address changes
+        self.index = 0
+        self.version = 0  # incremented for every sample, identifies cached pages
+        self.schedule_lag = 0  # ms the latest check started after it was due
+
+        # check duration and heap allocated during test_service. Allocations include any made by other tasks
+        # while the check was waiting, and checks where a collection ran are not counted
+        self.checks = 0
+        self.last_check_duration = 0
+        self.max_check_duration = 0
+        self.allocation_samples = 0
+        self.allocated = 0
 
         print("Initialized service {} {}".format(self.name, self.host))
         del config
 
-    async def monitor(self):
-        while True:
-            led(0)
-            latency = await self.test_service()
-            led(1)
-
-            self.history.append(latency)
-            if len(self.history) > self.max_history_length:
-                self.history.pop(0)
+    async def check(self):
+        start = time.ticks_ms()
+        allocated = gc.mem_alloc()
+        latency = await self.test_service()
+        allocated = gc.mem_alloc() - allocated
+        duration = time.ticks_diff(time.ticks_ms(), start)
+
+        self.checks += 1
+        self.last_check_duration = duration
+        if duration > self.max_check_duration:
+            self.max_check_duration = duration
+        if allocated >= 0:
+            self.allocation_samples += 1
+            self.allocated += allocated
+
+        self.record(latency, time.ticks_ms())
+        if self.history_log is not None:
+            self.history_log.append(self.index, latency)
+
+        if not isnan(latency):
+            print(self.name, "online", latency, "ms")  # printed piece by piece, formatting would allocate
+            self.failures = 0
+            self.status = True
+
+            if self.notified:
+                self.notified = False
+                for notifier in self.notifiers:
+                    notifier.enqueue(self, "online")
 
-            if not isnan(latency):
-                print("{} online {}ms".format(self.name, latency))
-                self.failures = 0
-                self.status = True
-
-                for notifier in range(len(self.notifiers)):
-                    if self.notified[notifier]:
-                        self.notified[notifier] = not await self.notifiers[notifier].notify(self, "online")
+        else:
+            print(self.name, "offline")
+            self.failures += 1
 
-            else:
-                print(self.name + " offline")
-                self.failures += 1
+            if self.failures >= self.notify_after_failures:
+                print(self.name + " reached failure threshold!")
+                self.status = False
 
-                if self.failures >= self.notify_after_failures:
-                    print(self.name + " reached failure threshold!")
-                    self.status = False
+                if not self.notified:
+                    self.notified = True
+                    for notifier in self.notifiers:  # outboxes retry until the notification is sent
+                        notifier.enqueue(self, "offline")
 
-                    for notifier in range(len(self.notifiers)):  # possible to not be notified at all if notifiers fail
-                        if not self.notified[notifier]:
-                            self.notified[notifier] = await self.notifiers[notifier].notify(self, "offline")
+    def record(self, latency, now):
+        self.version += 1
+        self.history.append(latency)
+        for rollup in self.rollups.values():
+            rollup.add(now, latency)
+        self.statistics.add(now, latency)
 
-            await asyncio.sleep(self.check_interval)
+    def set_history_log(self, history_log, index):
+        self.history_log = history_log
+        self.index = index
 
     async def test_service(self):
-        return float("nan")
+        return NAN
+
+    async def _resolve(self, port):
+        """Sets self.address to the host's current address. Returns False if the host could not be resolved."""
+        try:
+            address = await resolver.resolve(self.host)
+        except OSError:
+            print("Could not determine the address of", self.host)
+            return False
+        if self.address is None or self.address[0] != address:  # not rebuilt for every check
+            self.address = address, port
+        return True
 
     def get_name(self):
         return self.name
@@ -81,12 +135,48 @@ class Service:
     def get_history(self):
         return self.history
 
+    def get_rollup(self, resolution):
+        return self.rollups.get(resolution)
+
+    def get_statistics(self):
+        return self.statistics
+
+    def get_version(self):
+        return self.version
+
+    def get_check_stats(self):
+        """(checks, last duration ms, max duration ms, mean bytes allocated per check)"""
+        return self.checks, self.last_check_duration, self.max_check_duration, \
+            self.allocated // self.allocation_samples if self.allocation_samples else 0
+
+    def get_phases(self):
+        """PhaseHistory of the latency breakdown of recent checks, or None if the service type has none."""
+        return None
+
+    def get_connection_stats(self):
+        """(checks, of which reused a connection left open), or None if the service does not keep connections."""
+        return None
+
+    def get_schedule_lag(self):
+        return self.schedule_lag
+
+    def set_schedule_lag(self, lag):
+        self.schedule_lag = lag
+
+
+HTTP_PHASES = ("dns", "connect", "first_byte", "total")
+STALE_CONNECTION_ERRORS = (32, 103, 104, 107)  # EPIPE, ECONNABORTED, ECONNRESET, ENOTCONN
+
 
 class HTTPService(Service):
     def __init__(self, config, notifiers=None):
         Service.__init__(self, config, notifiers)
         self.port = (config["port"] if "port" in config else 80)
-        self.response_code = (str(config["response_code"]) if "response_code" in config else "200")
+        self.response_code = (int(config["response_code"]) if "response_code" in config else 200)
+        # the body is searched for the keyword, reading no more than body_limit bytes of it
+        self.keyword = (KeywordMatcher(config["keyword"].encode()) if "keyword" in config and config["keyword"] else None)
+        self.body_limit = (config["body_limit"] if "body_limit" in config else 4096)
+        self.response = ResponseReader()
 
         split = self.host.split('/', 1)
         if len(split) == 2:
@@ -94,183 +184,267 @@ class HTTPService(Service):
         else:
             self.path = '/'
 
+        self.phases = PhaseHistory(self.max_history_length, HTTP_PHASES)
+        self.phase_values = array('H', [MISSING] * len(HTTP_PHASES))  # reused for every check
+
+        # one HTTP/1.1 connection is kept open between checks, and the whole response read so it can be reused
+        self.keep_alive = (config["keep_alive"] if "keep_alive" in config else False)
+        self.connection = None  # (socket, stream) kept open from the previous check
+        self.requests = 0  # checks made in keep-alive mode
+        self.reused = 0  # of which were sent over an existing connection
+        self.request = bytes("GET /{} HTTP/1.{}\r\nHost: {}\r\n\r\n".format(
+            self.path, 1 if self.keep_alive else 0, self.host), "utf-8")
+
     async def test_service(self):
-        address = socket.getaddrinfo(self.host, self.port)[0][-1]
+        for phase in range(len(HTTP_PHASES)):
+            self.phase_values[phase] = MISSING
+        latency = await self._request(time.ticks_ms())
+        self.phases.append(self.phase_values)
+        return latency
+
+    async def _request(self, start):
+        """Fills in phase_values as each phase completes. Returns the time to first byte, as the latency.
+
+        In both modes the latency runs from the request being sent to the first byte of the response, so reusing a
+        connection removes the handshake from the connect phase but not from the latency.
+        """
+        if self.keep_alive:
+            self.requests += 1
+        if self.connection is not None:
+            latency = await self._exchange(start, None)
+            if latency is not None:
+                self.reused += 1
+                return latency
+            print("Connection to {} was closed by the server, reconnecting".format(self.host))
+
+        if not await self._resolve(self.port):
+            return NAN
+        resolved = time.ticks_ms()
+        self.phase_values[0] = time.ticks_diff(resolved, start)
 
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         sock.setblocking(False)
 
         try:
-            sock.connect(address)
+            sock.connect(self.address)
         except OSError as e:
             if e.errno != 115:
                 raise
 
-        reader = asyncio.StreamReader(sock)
-        writer = asyncio.StreamWriter(sock, {})
+        self.connection = (sock, asyncio.StreamReader(sock))  # uasyncio streams both read and write
+        latency = await self._exchange(start, resolved)
+        return latency if latency is not None else NAN
 
-        try:
-            writer.write(bytes("GET /{} HTTP/1.0\r\nHost: {}\r\n\r\n".format(self.path, self.host), "utf-8"))
-            await asyncio.wait_for(writer.drain(), self.timeout)
+    async def _exchange(self, start, resolved):
+        """Sends the request over self.connection and reads the response.
 
+        resolved is when the connection was opened, or None if it is being reused. Returns None if a reused
+        connection turns out to have been closed by the server before the response began.
+        """
+        stream = self.connection[1]
+        reusable = False
+
+        try:
+            # drain waits for the socket to become writable, which is when the connection is established
+            stream.write(self.request)
+            await asyncio.wait_for(stream.drain(), self.timeout)
             start_check_time = time.ticks_ms()
-            data = await asyncio.wait_for(reader.read(15), self.timeout)   # 15B will not work with HTTP versions >= 10
-            latency = time.ticks_ms() - start_check_time
+            if resolved is not None:
+                self.phase_values[1] = time.ticks_diff(start_check_time, resolved)
+
+            if not await asyncio.wait_for(self.response.first_byte(stream), self.timeout):  # closed without a response
+                return None if resolved is None else NAN
+            latency = time.ticks_diff(time.ticks_ms(), start_check_time)
+            self.phase_values[2] = latency
+
+            if not await asyncio.wait_for(self.response.read_head(stream), self.timeout):
+                return NAN
+            if self.keyword is not None:
+                self.keyword.reset()
+            if self.keyword is not None or self.keep_alive:
+                # a kept alive connection is only reused once the whole body has been read
+                complete = await asyncio.wait_for(self.response.read_body(stream, self.keyword, self.body_limit,
+                                                                          self.keep_alive), self.timeout)
+                reusable = self.keep_alive and complete and self.response.reusable
         except OSError as e:
+            if resolved is None and e.errno in STALE_CONNECTION_ERRORS:
+                return None
             if e.errno == 110:
-                return float("nan")
+                return NAN
             else:
                 raise
         except asyncio.TimeoutError:
-            return float("nan")
+            return NAN
         finally:
+            if not reusable:
+                await self._close()
+
+        self.phase_values[3] = time.ticks_diff(time.ticks_ms(), start)
+        if self.response.status != self.response_code:
+            return NAN
+        if self.keyword is not None and not self.keyword.found():
+            print("{} did not contain the keyword".format(self.name))
+            return NAN
+        return latency
+
+    async def _close(self):
+        if self.connection is not None:
+            sock, stream = self.connection
+            self.connection = None
             sock.close()
-            reader.close()
-            await reader.wait_closed()
-            writer.close()
-            await writer.wait_closed()
-
-        response_code = str(data, "utf-8").split()[1]
-        if self.response_code == response_code:
-            return latency
-        else:
-            return float("nan")
+            stream.close()
+            await stream.wait_closed()
+
+    def get_connection_stats(self):
+        return (self.requests, self.reused) if self.keep_alive else None
+
+    def get_phases(self):
+        return self.phases
 
 
 class ICMPService(Service):
     def __init__(self, config, notifiers=None):
         Service.__init__(self, config, notifiers)
-
-    def checksum(self, data):
-        if len(data) & 0x1:  # Odd number of bytes
-            data += b'\0'
-        cs = 0
-        for pos in range(0, len(data), 2):
-            b1 = data[pos]
-            b2 = data[pos + 1]
-            cs += (b1 << 8) + b2
-        while cs >= 0x10000:
-            cs = (cs & 0xffff) + (cs >> 16)
-        cs = ~cs & 0xffff
-        return cs
+        self.request = None  # reused by every ping, created with the ICMP engine
 
     async def test_service(self):
-        size = 64
-        # prepare packet
-        pkt = b'Q' * size
-        pkt_desc = {
-            "type": uctypes.UINT8 | 0,
-            "code": uctypes.UINT8 | 1,
-            "checksum": uctypes.UINT16 | 2,
-            "id": (uctypes.ARRAY | 4, 2 | uctypes.UINT8),
-            "seq": uctypes.INT16 | 6,
-            "timestamp": uctypes.UINT64 | 8,
-        }  # packet header descriptor
-        h = uctypes.struct(uctypes.addressof(pkt), pkt_desc, uctypes.BIG_ENDIAN)
-        h.type = 8  # ICMP_ECHO_REQUEST
-        h.code = 0
-        h.checksum = 0
-        h.id[0:2] = uos.urandom(2)
-        h.seq = 1
+        if not await self._resolve(1):
+            return NAN
 
-        # needed because wifi pings are super temperamental
-        for seq in range(5):
-            try:
-                addr = socket.getaddrinfo(self.host, 1)[0][-1][0]  # ip address
-            except IndexError:
-                print("Could not determine the address of", self.host)
-                return float("nan")
-
-            # init socket
-            sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, 1)
-            sock.setblocking(False)
-
-            try:
-                sock.connect((addr, 1))
-            except OSError as e:
-                if e.errno != 115:
-                    raise
-
-            reader = asyncio.StreamReader(sock)
-            writer = asyncio.StreamWriter(sock, {})
-
-            h.seq = seq
-            h.timestamp = time.ticks_us()
-            h.checksum = self.checksum(pkt)
-
-            try:
-                writer.write(pkt)
-                await asyncio.wait_for(writer.drain(), self.timeout)
-
-                start_check_time = time.ticks_ms()
-                resp = await asyncio.wait_for(reader.readexactly(64), self.timeout)
-                latency = time.ticks_ms() - start_check_time
-            except OSError as e:
-                if e.errno == 110:
-                    continue
-                else:
-                    raise
-            except asyncio.TimeoutError:
-                continue
-            finally:
-                sock.close()
-                reader.close()
-                await reader.wait_closed()
-                writer.close()
-                await writer.wait_closed()
+        import icmp  # only loaded when ICMP services are configured
 
-            resp_mv = memoryview(resp)
-            h2 = uctypes.struct(uctypes.addressof(resp_mv[20:]), pkt_desc, uctypes.BIG_ENDIAN)
+        engine = icmp.get_engine()
+        if self.request is None:
+            self.request = engine.create_request()
 
-            if h2.type == 0 and h2.id == h.id and h2.seq == seq:
+        # needed because wifi pings are super temperamental
+        for attempt in range(5):
+            latency = await engine.ping(self.address, self.timeout, self.request)
+            if not isnan(latency):
                 return latency
 
-        return float("nan")
+        return NAN
+
+
+class DatagramService(Service):
+    """Sends self.request to the port in one datagram and measures the time until a reply arrives. The start of the
+    reply is read into self.response, and subclasses check it in reply_ok."""
+
+    async def test_service(self):
+        if not await self._resolve(self.port):
+            return NAN
+
+        # a socket per check, as the ESP8266 has few UDP sockets to keep one open for each service
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setblocking(False)
+        stream = asyncio.StreamReader(sock)
+
+        try:
+            sock.connect(self.address)
+            # sent directly, as a stream does not send anything for an empty request
+            sock.send(self.request)
+            start_check_time = time.ticks_ms()
+            length = await asyncio.wait_for(stream.readinto(self.response), self.timeout)
+            latency = time.ticks_diff(time.ticks_ms(), start_check_time)
+        except OSError as e:  # includes the port being reported unreachable
+            print("No reply from {}: {}".format(self.host, e))
+            return NAN
+        except asyncio.TimeoutError:
+            return NAN
+        finally:
+            sock.close()
+            stream.close()
+            await stream.wait_closed()
+
+        return latency if length is not None and self.reply_ok(length) else NAN
+
+    def reply_ok(self, length):
+        return True
+
 
+class DNSService(DatagramService):
+    def __init__(self, config, notifiers=None):
+        DatagramService.__init__(self, config, notifiers)
+        self.port = (config["port"] if "port" in config else 53)
+        self.request = DNS_QUERY
+        self.response = bytearray(4)  # ID and flags, the rest of the reply is discarded
+
+    def reply_ok(self, length):
+        # Checks if response has same ID as request and if RCODE=3 (NXDOMAIN)
+        response = self.response
+        return length == 4 and response[0] == 0xAA and response[1] == 0xAA and response[3] & 0x0F == 3
+
+
+class TCPService(Service):
+    """Measures how long the port takes to accept a connection. Nothing is sent over the connection."""
 
-class DNSService(Service):
     def __init__(self, config, notifiers=None):
         Service.__init__(self, config, notifiers)
+        self.port = config["port"]
+        self.poller = uselect.poll()
 
     async def test_service(self):
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        address = socket.getaddrinfo(self.host, 53)[0][-1]
+        if not await self._resolve(self.port):
+            return NAN
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         sock.setblocking(False)
+        start = time.ticks_ms()
 
         try:
-            sock.connect(address)
+            sock.connect(self.address)
         except OSError as e:
             if e.errno != 115:
-                raise
-
-        reader = asyncio.StreamReader(sock)
-        writer = asyncio.StreamWriter(sock, {})
+                print("Could not connect to {}: {}".format(self.host, e))
+                sock.close()
+                return NAN
 
+        self.poller.register(sock, uselect.POLLOUT)
         try:
-            writer.write(b"\xAA\xAA\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00"
-                         b"\x0a\x6d\x69\x6e\x75\x74\x65\x70\x69\x6e\x67\x04\x74\x65\x73\x74"  # minuteping.test
-                         b"\x00\x00\x01\x00\x01")
-            await asyncio.wait_for(writer.drain(), self.timeout)
-
-            start_check_time = time.ticks_ms()
-            result = await asyncio.wait_for(reader.read(8), self.timeout)
-            latency = time.ticks_ms() - start_check_time
-        except OSError as e:
-            if e.errno == 110:
-                return float("nan")
-            else:
-                raise
+            return await asyncio.wait_for(self._connected(sock, start), self.timeout)
         except asyncio.TimeoutError:
-            return float("nan")
+            return NAN
         finally:
+            self.poller.unregister(sock)
             sock.close()
-            reader.close()
-            await reader.wait_closed()
-            writer.close()
-            await writer.wait_closed()
 
-        # Checks if response has same ID as request and if RCODE=3 (NXDOMAIN)
-        if result[0:2] == b"\xAA\xAA" and result[3] & 0x0F == 3:
-            return latency
-        else:
-            return float("nan")
+    async def _connected(self, sock, start):
+        """Waits for the socket to become writable, which is when the connection is established or refused."""
+        await _Writable(sock)
+        latency = time.ticks_diff(time.ticks_ms(), start)
+        for polled, event in self.poller.ipoll(0):
+            if event & (uselect.POLLERR | uselect.POLLHUP):
+                return NAN
+        return latency
+
+
+class UDPService(DatagramService):
+    """Sends payload to the port and waits for a reply, which must begin with response_prefix if one is set."""
+
+    def __init__(self, config, notifiers=None):
+        DatagramService.__init__(self, config, notifiers)
+        self.port = config["port"]
+        self.request = (config["payload"] if "payload" in config else "").encode()
+        self.response_prefix = (config["response_prefix"] if "response_prefix" in config else "").encode()
+        self.response = bytearray(max(len(self.response_prefix), 1))  # the rest of the reply is discarded
+
+    def reply_ok(self, length):
+        if length < len(self.response_prefix):
+            return False
+        for i in range(len(self.response_prefix)):
+            if self.response[i] != self.response_prefix[i]:
+                return False
+        return True
+
+
+class _Writable:
+    """Awaited until sock is writable. The task waits in the uasyncio IO queue, as in Stream.drain, rather than
+    polling."""
+
+    def __init__(self, sock):
+        self.sock = sock
+
+    def __iter__(self):
+        yield asyncio.core._io_queue.queue_write(self.sock)
+
+    __await__ = __iter__
@@ -2,7 +2,9 @@
 # Copyright (c) 2018 Shawwwn <shawwwn1@gmai.com>
 # License: MIT
 import usocket
+import utime
 import uasyncio as asyncio
+import resolver
 
 TIMEOUT = 5 # sec
 LOCAL_DOMAIN = '127.0.0.1'
@@ -14,8 +16,48 @@ AUTH_PLAIN = 'PLAIN'
 AUTH_LOGIN = 'LOGIN'
 
 class SMTP:
-    def __init__(self):
-        pass
+    # idle_timeout: seconds an authenticated session is kept open after release() for the next message.
+    # 0 closes the session as soon as it is released
+    def __init__(self, idle_timeout=0):
+        self.sock = None
+        self.idle_timeout = idle_timeout
+        self.lock = asyncio.Lock()  # held from connect() until release()
+        self.last_used = 0
+        self.closer = None
+
+    async def connect(self, host, port, username, password):
+        # reuses the open session if the server still answers, otherwise logs in again.
+        # must be followed by release(), including when an exception is raised
+        await self.lock.acquire()
+        if self.sock is not None:
+            try:
+                code, resp = await self.cmd('RSET')
+                if code == 250:
+                    return code, resp
+            except (OSError, ValueError, EOFError, asyncio.TimeoutError):
+                pass
+            await self.close()
+        return await self.login(host, port, username, password)
+
+    def release(self):
+        # marks the session as free, closing it once it has been idle for idle_timeout
+        self.last_used = utime.ticks_ms()
+        self.lock.release()
+        if self.sock is not None and self.closer is None:
+            self.closer = asyncio.create_task(self._close_when_idle())
+
+    async def _close_when_idle(self):
+        try:
+            while self.sock is not None:
+                remaining = self.idle_timeout * 1000 - utime.ticks_diff(utime.ticks_ms(), self.last_used)
+                if remaining <= 0:
+                    async with self.lock:
+                        if utime.ticks_diff(utime.ticks_ms(), self.last_used) >= self.idle_timeout * 1000:
+                            await self.quit()
+                    continue
+                await asyncio.sleep_ms(remaining)
+        finally:
+            self.closer = None
 
     async def cmd(self, cmd_str):
         self.writer.write('%s\r\n' % cmd_str)
@@ -33,7 +75,7 @@ class SMTP:
     async def login(self, host, port, username, password):
         self.username = username
 
-        addr = usocket.getaddrinfo(host, port)[0][-1]
+        addr = (await resolver.resolve(host), port)
         self.sock = usocket.socket(usocket.AF_INET, usocket.SOCK_STREAM)
         self.sock.setblocking(False)
 
@@ -75,8 +117,6 @@ class SMTP:
         return code, resp
 
     async def to(self, addrs):
-        code, resp = await self.cmd(CMD_EHLO + ' ' + LOCAL_DOMAIN)
-        assert code==250, '%d' % code
         code, resp = await self.cmd('MAIL FROM: <%s>' % self.username)
         assert code==250, 'sender refused %d, %s' % (code, resp)
 
@@ -103,10 +143,19 @@ class SMTP:
         line = await asyncio.wait_for(self.reader.readline(), TIMEOUT)
         return (int(line[:3]), line[4:].strip().decode())
 
-    def quit(self):
-        await self.cmd("QUIT")
-
-        self.sock.close()
+    async def quit(self):
+        try:
+            await self.cmd("QUIT")
+        except (OSError, ValueError, EOFError, asyncio.TimeoutError):
+            pass
+        await self.close()
+
+    async def close(self):
+        if self.sock is None:
+            return
+        sock = self.sock
+        self.sock = None
+        sock.close()
         self.reader.close()
         await self.reader.wait_closed()
         self.writer.close()